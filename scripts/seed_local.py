@@ -393,17 +393,7 @@ async def seed_vectorstore():
 
     await ChromaStore.initialize(settings.chroma_persist_dir)
 
-    success_count = 0
-    for p in SAMPLE_PRODUCTS:
-        success = await ChromaStore.upsert_product(
-            product_id=p["id"],
-            name=p["name"],
-            description=p["description"],
-            category=p["category"],
-            sku=p["sku"]
-        )
-        if success:
-            success_count += 1
+    success_count = await ChromaStore.upsert_products_bulk(SAMPLE_PRODUCTS)
 
     print(f"   Indexed {success_count}/{len(SAMPLE_PRODUCTS)} products")
 
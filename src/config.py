@@ -10,6 +10,10 @@ class Settings(BaseSettings):
 
     # SQLite Database (Local)
     database_url: str = "sqlite+aiosqlite:///./data/app.db"
+    database_pool_size: int = 20
+    database_max_overflow: int = 40
+    database_busy_timeout: int = 10  # seconds to wait on a locked database
+    database_pool_timeout: int = 5  # seconds to wait for a pooled connection
 
     # ChromaDB (Local Vector Store)
     chroma_persist_dir: str = "./data/chroma_db"
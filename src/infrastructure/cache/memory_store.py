@@ -13,6 +13,13 @@ import json
 
 logger = logging.getLogger(__name__)
 
+# Key namespaces
+_CART_PREFIX = "cart:"
+_MESSAGES_PREFIX = "messages:"
+_CONV_META_PREFIX = "conv_meta:"
+_SESSION_PREFIX = "session:"
+_LOCK_PREFIX = "lock:"
+
 
 class MemoryStore:
     """
@@ -20,12 +27,15 @@ class MemoryStore:
     Replaces Upstash Redis for local development/deployment
     """
 
-    def __init__(self):
-        self._data: Dict[str, Any] = {}
+    DEFAULT_MAX_KEYS = 100_000
+
+    def __init__(self, max_keys: int = DEFAULT_MAX_KEYS):
+        self._data: Dict[str, Any] = {}  # insertion-ordered: oldest key first
         self._expiry: Dict[str, float] = {}  # key -> timestamp when it expires
         self._lock = threading.RLock()
         self._cleanup_interval = 60  # seconds between cleanup runs
         self._last_cleanup = time.time()
+        self._max_keys = max_keys
 
     def _maybe_cleanup(self):
         """Lazy cleanup - run periodically, not on every operation"""
@@ -45,6 +55,19 @@ class MemoryStore:
             self._data.pop(key, None)
             self._expiry.pop(key, None)
 
+    def _make_room(self, key: str):
+        """
+        Keep the store bounded: before adding a new key at capacity, drop
+        expired keys, then evict the oldest keys if still full
+        """
+        if key in self._data or len(self._data) < self._max_keys:
+            return
+        self._cleanup_expired()
+        while len(self._data) >= self._max_keys:
+            oldest = next(iter(self._data))
+            self._data.pop(oldest, None)
+            self._expiry.pop(oldest, None)
+
     def _is_expired(self, key: str) -> bool:
         """Check if a key is expired"""
         if key not in self._expiry:
@@ -72,6 +95,7 @@ class MemoryStore:
             True on success
         """
         with self._lock:
+            self._make_room(key)
             self._data[key] = value
             if ttl is not None:
                 self._expiry[key] = time.time() + ttl
@@ -119,6 +143,7 @@ class MemoryStore:
     def incr(self, key: str, amount: int = 1) -> int:
         """Increment numeric value (atomic)"""
         with self._lock:
+            self._make_room(key)
             current = self.get(key)
             if current is None:
                 current = 0
@@ -133,6 +158,7 @@ class MemoryStore:
     def hset(self, key: str, field: str, value: Any) -> bool:
         """Set hash field"""
         with self._lock:
+            self._make_room(key)
             if key not in self._data:
                 self._data[key] = {}
             elif not isinstance(self._data[key], dict):
@@ -140,6 +166,18 @@ class MemoryStore:
             self._data[key][field] = value
             return True
 
+    def hset_many(self, key: str, mapping: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """Set several hash fields and (optionally) the key TTL under one lock"""
+        with self._lock:
+            self._make_room(key)
+            data = self._data.get(key)
+            if not isinstance(data, dict):
+                data = self._data[key] = {}
+            data.update(mapping)
+            if ttl is not None:
+                self._expiry[key] = time.time() + ttl
+            return True
+
     def hget(self, key: str, field: str) -> Optional[Any]:
         """Get hash field"""
         with self._lock:
@@ -163,6 +201,7 @@ class MemoryStore:
     def lpush(self, key: str, value: Any) -> int:
         """Push value to left of list"""
         with self._lock:
+            self._make_room(key)
             if key not in self._data:
                 self._data[key] = []
             elif not isinstance(self._data[key], list):
@@ -173,6 +212,7 @@ class MemoryStore:
     def rpush(self, key: str, value: Any) -> int:
         """Push value to right of list"""
         with self._lock:
+            self._make_room(key)
             if key not in self._data:
                 self._data[key] = []
             elif not isinstance(self._data[key], list):
@@ -180,6 +220,32 @@ class MemoryStore:
             self._data[key].append(value)
             return len(self._data[key])
 
+    def rpush_capped(
+        self,
+        key: str,
+        value: Any,
+        max_len: Optional[int] = None,
+        ttl: Optional[int] = None
+    ) -> int:
+        """
+        RPUSH + LTRIM + EXPIRE in one step (like a Redis pipeline)
+
+        Returns:
+            List length after the push, before trimming
+        """
+        with self._lock:
+            self._make_room(key)
+            data = self._data.get(key)
+            if not isinstance(data, list):
+                data = self._data[key] = []
+            data.append(value)
+            count = len(data)
+            if max_len is not None and count > max_len:
+                del data[:count - max_len]
+            if ttl is not None:
+                self._expiry[key] = time.time() + ttl
+            return count
+
     def lrange(self, key: str, start: int, end: int) -> List[Any]:
         """Get range of list"""
         with self._lock:
@@ -243,7 +309,7 @@ class CartStore:
         self._ttl = 3600  # 1 hour
 
     def _key(self, conversation_id: str) -> str:
-        return f"cart:{conversation_id}"
+        return _CART_PREFIX + conversation_id
 
     def get_cart(self, conversation_id: str) -> Dict[str, Any]:
         """Get cart for conversation"""
@@ -333,10 +399,10 @@ class ConversationStore:
         self._ttl = 7200  # 2 hours
 
     def _key(self, conversation_id: str) -> str:
-        return f"messages:{conversation_id}"
+        return _MESSAGES_PREFIX + conversation_id
 
     def _metadata_key(self, conversation_id: str) -> str:
-        return f"conv_meta:{conversation_id}"
+        return _CONV_META_PREFIX + conversation_id
 
     def add_message(
         self,
@@ -353,14 +419,10 @@ class ConversationStore:
             "timestamp": datetime.utcnow().isoformat(),
             "metadata": metadata or {},
         }
-        count = self._store.rpush(key, message)
-        self._store.expire(key, self._ttl)
-
-        # Trim to max messages
-        if count > self._max_messages:
-            self._store.ltrim(key, -self._max_messages, -1)
-
-        return count
+        # Push, trim to max messages and refresh TTL in one store call
+        return self._store.rpush_capped(
+            key, message, max_len=self._max_messages, ttl=self._ttl
+        )
 
     def get_messages(
         self,
@@ -403,7 +465,7 @@ class SessionStore:
         self._ttl = 3600  # 1 hour
 
     def _key(self, session_id: str) -> str:
-        return f"session:{session_id}"
+        return _SESSION_PREFIX + session_id
 
     def get_session(self, session_id: str) -> Dict[str, Any]:
         """Get session data"""
@@ -411,18 +473,11 @@ class SessionStore:
 
     def set_session(self, session_id: str, data: Dict[str, Any]) -> bool:
         """Set session data"""
-        key = self._key(session_id)
-        for field, value in data.items():
-            self._store.hset(key, field, value)
-        self._store.expire(key, self._ttl)
-        return True
+        return self._store.hset_many(self._key(session_id), data, ttl=self._ttl)
 
     def update_field(self, session_id: str, field: str, value: Any) -> bool:
         """Update single session field"""
-        key = self._key(session_id)
-        self._store.hset(key, field, value)
-        self._store.expire(key, self._ttl)
-        return True
+        return self._store.hset_many(self._key(session_id), {field: value}, ttl=self._ttl)
 
     def delete_session(self, session_id: str) -> bool:
         """Delete session"""
@@ -439,7 +494,7 @@ class LockManager:
         self._default_ttl = 10  # 10 seconds
 
     def _key(self, name: str) -> str:
-        return f"lock:{name}"
+        return _LOCK_PREFIX + name
 
     def acquire(self, name: str, ttl: Optional[int] = None) -> bool:
         """Acquire lock, returns True if successful"""
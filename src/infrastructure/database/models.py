@@ -7,7 +7,7 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 from sqlalchemy import (
     Column, String, Integer, Float, Boolean, DateTime, JSON,
-    ForeignKey, Index, UniqueConstraint, create_engine, event
+    ForeignKey, Index, UniqueConstraint, create_engine, event, text
 )
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
@@ -163,11 +163,16 @@ class StockReservationModel(Base):
     expires_at = Column(DateTime, nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    # Relationships
-    product = relationship("ProductModel", back_populates="stock_reservations")
+    # Relationships (lazy="raise": load explicitly, e.g. selectinload, to avoid N+1)
+    product = relationship("ProductModel", back_populates="stock_reservations", lazy="raise")
 
     __table_args__ = (
         Index("ix_stock_reservations_product_conversation", "product_id", "conversation_id"),
+        # Hot paths: SUM(quantity) per product and cart reads per conversation, both filtered by expiry
+        Index("ix_stock_reservations_product_expires", "product_id", "expires_at"),
+        Index("ix_stock_reservations_conversation_expires", "conversation_id", "expires_at"),
+        # One reservation per product per conversation (UPSERT conflict target)
+        Index("uq_stock_reservations_conversation_product", "conversation_id", "product_id", unique=True),
     )
 
 
@@ -208,8 +213,8 @@ class PlacePostModel(Base):
     meta_data = Column(JSON, default={})
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # category's index=True already creates ix_place_posts_category
     __table_args__ = (
-        Index("ix_place_posts_category", "category"),
         Index("ix_place_posts_location", "latitude", "longitude"),
     )
 
@@ -231,6 +236,25 @@ class ConversationModel(Base):
     )
 
 
+class ConversationMessageModel(Base):
+    """Messages added outside the agent graph (supervisor replies, follow-ups)"""
+    __tablename__ = "conversation_messages"
+
+    id = Column(String, primary_key=True)
+    conversation_id = Column(String, nullable=False)
+    role = Column(String, nullable=False)  # assistant, supervisor
+    content = Column(String, nullable=False)
+    type = Column(String, nullable=True)  # followup
+    action = Column(String, nullable=True)  # supervisor action
+    escalation_id = Column(String, nullable=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Follow-up polling: conversation + type, range/sort on timestamp
+        Index("ix_conversation_messages_conv_type_ts", "conversation_id", "type", "timestamp"),
+    )
+
+
 class UserModel(Base):
     """User profile model for guest and registered users"""
     __tablename__ = "users"
@@ -248,23 +272,32 @@ class UserModel(Base):
 # Enable SQLite WAL mode for better concurrency
 # ============================================================================
 
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # concurrent readers during writes
+    "PRAGMA synchronous=NORMAL",  # safe with WAL, far fewer fsyncs
+    "PRAGMA temp_store=MEMORY",  # sorts/temp tables stay in RAM
+    "PRAGMA mmap_size=268435456",  # 256 MB memory-mapped reads
+)
+
+
+def _apply_pragmas(dbapi_conn):
+    cursor = dbapi_conn.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
 def configure_sqlite(dbapi_conn, connection_record):
-    """Enable WAL mode for SQLite"""
+    """Enable WAL mode and connection-level tuning for SQLite"""
     try:
         # Handle both regular and async connections
         if hasattr(dbapi_conn, "driver"):
             if dbapi_conn.driver == "pysqlite":
-                cursor = dbapi_conn.cursor()
-                cursor.execute("PRAGMA journal_mode=WAL")
-                cursor.execute("PRAGMA synchronous=NORMAL")
-                cursor.close()
+                _apply_pragmas(dbapi_conn)
         else:
             # AsyncAdapt connection - try to configure anyway
             try:
-                cursor = dbapi_conn.cursor()
-                cursor.execute("PRAGMA journal_mode=WAL")
-                cursor.execute("PRAGMA synchronous=NORMAL")
-                cursor.close()
+                _apply_pragmas(dbapi_conn)
             except:
                 # If it fails, skip silently
                 pass
@@ -272,6 +305,55 @@ def configure_sqlite(dbapi_conn, connection_record):
         print(f"[SQLite] Warning: Could not configure SQLite pragmas: {e}")
 
 
+def merge_duplicate_stock_reservations(sync_conn):
+    """
+    Collapse duplicate (conversation_id, product_id) reservations into one row
+    so uq_stock_reservations_conversation_product can be created on databases
+    written before the index existed. Quantities are summed and the latest
+    expiry is kept.
+    """
+    duplicates = """
+        SELECT conversation_id, product_id, MIN(rowid) AS keep_rowid,
+               SUM(quantity) AS quantity, MAX(expires_at) AS expires_at
+        FROM stock_reservations
+        GROUP BY conversation_id, product_id
+        HAVING COUNT(*) > 1
+    """
+    rows = sync_conn.execute(text(duplicates)).all()
+    for row in rows:
+        sync_conn.execute(
+            text(
+                "UPDATE stock_reservations SET quantity = :quantity, expires_at = :expires_at "
+                "WHERE rowid = :keep_rowid"
+            ),
+            {"quantity": row.quantity, "expires_at": row.expires_at, "keep_rowid": row.keep_rowid},
+        )
+        sync_conn.execute(
+            text(
+                "DELETE FROM stock_reservations "
+                "WHERE conversation_id = :conversation_id AND product_id = :product_id "
+                "AND rowid != :keep_rowid"
+            ),
+            {
+                "conversation_id": row.conversation_id,
+                "product_id": row.product_id,
+                "keep_rowid": row.keep_rowid,
+            },
+        )
+    if rows:
+        print(f"[SQLite] Merged {len(rows)} duplicate stock reservation group(s)")
+
+
+def create_missing_indexes(sync_conn):
+    """
+    Create indexes added to the models after their tables already existed.
+    create_all() skips existing tables entirely, including their indexes.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
 def register_sqlite_pragma(engine):
     """Register SQLite pragma configuration"""
     if "sqlite" in str(engine.url):
@@ -8,16 +8,78 @@ from typing import Any, Dict, List, Optional
 from datetime import datetime
 import uuid
 
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, func, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from .sqlite_db import Database
 from .models import (
     OrderModel, OrderItemModel, CustomerModel, ConversationModel,
-    ProductModel, CouponModel, DeliverySlotModel, DistrictModel,
-    EscalationModel, StockReservationModel, UserModel
+    ConversationMessageModel, ProductModel, CouponModel, DeliverySlotModel,
+    DistrictModel, EscalationModel, StockReservationModel, UserModel
 )
 
 
+# Mongo comparison operators supported in filters
+_OPERATORS = {
+    "$gt": lambda column, value: column > value,
+    "$gte": lambda column, value: column >= value,
+    "$lt": lambda column, value: column < value,
+    "$lte": lambda column, value: column <= value,
+    "$ne": lambda column, value: column != value,
+    "$in": lambda column, value: column.in_(value),
+    "$nin": lambda column, value: column.not_in(value),
+}
+
+
+class MongoCursor:
+    """
+    Simulates a Motor cursor. sort/skip/limit are pushed into the SQL query,
+    which runs once on to_list() or iteration.
+    """
+
+    def __init__(self, collection: "MongoCollection", filter_dict: Optional[Dict[str, Any]],
+                 projection: Optional[Dict[str, Any]] = None):
+        self._collection = collection
+        self._filter = filter_dict or {}
+        self._projection = projection
+        self._order_by = []
+        self._skip = 0
+        self._limit: Optional[int] = None
+
+    def sort(self, key_or_list, direction: int = 1) -> "MongoCursor":
+        """Sort by a field, or by a list of (field, direction) pairs"""
+        keys = key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction)]
+        for key, key_direction in keys:
+            column = self._collection._column(key)
+            if column is not None:
+                self._order_by.append(column.desc() if key_direction < 0 else column.asc())
+        return self
+
+    def skip(self, count: int) -> "MongoCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MongoCursor":
+        self._limit = count or None  # limit(0) means no limit in MongoDB
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        """Fetch all matching documents (at most `length`) in one query"""
+        limit = self._limit
+        if length:
+            limit = min(limit, length) if limit else length
+        return await self._collection._fetch(
+            self._filter, self._order_by, self._skip, limit, self._projection
+        )
+
+    async def _iterate(self):
+        for doc in await self.to_list():
+            yield doc
+
+    def __aiter__(self):
+        return self._iterate()
+
+
 class MongoCollection:
     """Simulates a MongoDB collection using SQLAlchemy"""
 
@@ -30,10 +92,18 @@ class MongoCollection:
         session_gen = self.session_factory()
         return await anext(session_gen)
 
-    async def find_one(self, filter_dict: Dict[str, Any]) -> Optional[Dict]:
+    async def find_one(self, filter_dict: Dict[str, Any],
+                       projection: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
         """Find a single document matching the filter"""
         session = await self._get_session()
         try:
+            columns = self._projected_columns(projection)
+            if columns:
+                # Inclusion projection on plain columns: select only those
+                stmt = self._apply_filter(select(*columns.values()), filter_dict).limit(1)
+                row = (await session.execute(stmt)).first()
+                return self._row_to_dict(columns, row) if row else None
+
             # Build query from filter
             stmt = select(self.model_class)
             for key, value in filter_dict.items():
@@ -50,36 +120,135 @@ class MongoCollection:
                 if hasattr(self.model_class, key):
                     stmt = stmt.where(getattr(self.model_class, key) == value)
 
-            result = await session.execute(stmt)
+            result = await session.execute(self._load_items(stmt))
             row = result.scalar_one_or_none()
 
             if row:
-                return self._model_to_dict(row)
+                doc = self._model_to_dict(row)
+                return self._project(doc, projection) if projection else doc
             return None
         finally:
             await session.close()
 
-    async def find(self, filter_dict: Dict[str, Any] = None, limit: int = 100) -> List[Dict]:
-        """Find documents matching the filter"""
+    def find(self, filter_dict: Dict[str, Any] = None,
+             projection: Optional[Dict[str, Any]] = None) -> MongoCursor:
+        """Find documents matching the filter (returns a Motor-style cursor)"""
+        return MongoCursor(self, filter_dict, projection)
+
+    def _column(self, key: str):
+        """Model column for a document field (None if the model lacks it)"""
+        if key == "_id":
+            key = "id"
+        elif key == "order_id" and hasattr(self.model_class, "order_number"):
+            key = "order_number"
+        return getattr(self.model_class, key, None)
+
+    def _conditions(self, filter_dict: Optional[Dict[str, Any]]) -> List[Any]:
+        """SQL conditions for equality, $-operator and $or filters"""
+        conditions = []
+        for key, value in (filter_dict or {}).items():
+            if key == "$or":
+                conditions.append(or_(*(and_(*self._conditions(branch)) for branch in value)))
+                continue
+            column = self._column(key)
+            if column is None:
+                continue
+            if isinstance(value, dict) and value and all(op in _OPERATORS for op in value):
+                for op, operand in value.items():
+                    conditions.append(_OPERATORS[op](column, operand))
+            else:
+                conditions.append(column == value)
+        return conditions
+
+    def _apply_filter(self, stmt, filter_dict: Optional[Dict[str, Any]]):
+        """Add WHERE clauses for the filter"""
+        conditions = self._conditions(filter_dict)
+        return stmt.where(*conditions) if conditions else stmt
+
+    def _projected_columns(self, projection: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Field -> column map for an inclusion projection that names only plain
+        table columns, so the query can select just those. None otherwise.
+        """
+        if not projection:
+            return None
+        table_columns = self.model_class.__table__.columns
+        include = [key for key, flag in projection.items() if flag and key != "_id"]
+        if not include:
+            return None
+        columns = {}
+        for key in include:
+            name = "order_number" if key == "order_id" and "order_number" in table_columns else key
+            if name not in table_columns:
+                return None  # e.g. an order's items, which come from a join
+            columns[key] = table_columns[name]
+        if projection.get("_id", 1):
+            columns["_id"] = table_columns["id"]
+        return columns
+
+    def _load_items(self, stmt):
+        """
+        Orders carry their items; load them (and each item's product) in one
+        batched query. Lazy loading is not possible on an AsyncSession.
+        """
+        if hasattr(self.model_class, "items"):
+            stmt = stmt.options(
+                selectinload(self.model_class.items).selectinload(OrderItemModel.product)
+            )
+        return stmt
+
+    @staticmethod
+    def _row_to_dict(columns: Dict[str, Any], row) -> Dict:
+        """Build a document from a row selected by _projected_columns"""
+        return {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in zip(columns, row)
+        }
+
+    async def _fetch(self, filter_dict, order_by, skip: int, limit: Optional[int],
+                     projection: Optional[Dict[str, Any]]) -> List[Dict]:
+        """Run a cursor's query: filter, sort, skip and limit all in SQL"""
         session = await self._get_session()
         try:
-            stmt = select(self.model_class)
+            columns = self._projected_columns(projection)
+            if columns:
+                stmt = self._apply_filter(select(*columns.values()), filter_dict)
+                if order_by:
+                    stmt = stmt.order_by(*order_by)
+                if skip:
+                    stmt = stmt.offset(skip)
+                if limit:
+                    stmt = stmt.limit(limit)
+                result = await session.execute(stmt)
+                return [self._row_to_dict(columns, row) for row in result]
 
-            if filter_dict:
-                for key, value in filter_dict.items():
-                    if key == "_id":
-                        key = "id"
-                    if hasattr(self.model_class, key):
-                        stmt = stmt.where(getattr(self.model_class, key) == value)
+            stmt = self._load_items(self._apply_filter(select(self.model_class), filter_dict))
+            if order_by:
+                stmt = stmt.order_by(*order_by)
+            if skip:
+                stmt = stmt.offset(skip)
+            if limit:
+                stmt = stmt.limit(limit)
 
-            stmt = stmt.limit(limit)
             result = await session.execute(stmt)
-            rows = result.scalars().all()
-
-            return [self._model_to_dict(row) for row in rows]
+            docs = [self._model_to_dict(row) for row in result.scalars()]
+            if projection:
+                docs = [self._project(doc, projection) for doc in docs]
+            return docs
         finally:
             await session.close()
 
+    @staticmethod
+    def _project(doc: Dict, projection: Dict[str, Any]) -> Dict:
+        """Apply a MongoDB projection (inclusion or exclusion) to a document"""
+        include = [key for key, flag in projection.items() if flag and key != "_id"]
+        if include:
+            projected = {key: doc[key] for key in include if key in doc}
+            if projection.get("_id", 1) and "_id" in doc:
+                projected["_id"] = doc["_id"]
+            return projected
+        return {key: value for key, value in doc.items() if projection.get(key, 1)}
+
     async def insert_one(self, document: Dict[str, Any]) -> Dict:
         """Insert a single document"""
         session = await self._get_session()
@@ -100,6 +269,24 @@ class MongoCollection:
         finally:
             await session.close()
 
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True) -> Dict:
+        """Insert several documents in one transaction"""
+        session = await self._get_session()
+        try:
+            ids = []
+            for document in documents:
+                if "_id" not in document and "id" not in document:
+                    document["id"] = str(uuid.uuid4())
+                elif "_id" in document:
+                    document["id"] = document.pop("_id")
+                session.add(self.model_class(**self._dict_to_model_data(document)))
+                ids.append(document["id"])
+            await session.commit()
+
+            return {"inserted_ids": ids}
+        finally:
+            await session.close()
+
     async def update_one(self, filter_dict: Dict[str, Any], update_dict: Dict[str, Any]) -> Dict:
         """Update a single document"""
         session = await self._get_session()
@@ -160,8 +347,22 @@ class MongoCollection:
 
     async def count_documents(self, filter_dict: Dict[str, Any] = None) -> int:
         """Count documents matching the filter"""
-        docs = await self.find(filter_dict)
-        return len(docs)
+        session = await self._get_session()
+        try:
+            stmt = self._apply_filter(
+                select(func.count()).select_from(self.model_class), filter_dict
+            )
+            result = await session.execute(stmt)
+            return result.scalar_one()
+        finally:
+            await session.close()
+
+    async def estimated_document_count(self) -> int:
+        """
+        Count all documents. SQLite keeps no row-count metadata, so this is an
+        unfiltered COUNT(*), which it answers from the smallest index
+        """
+        return await self.count_documents()
 
     def _model_to_dict(self, model) -> Dict:
         """Convert SQLAlchemy model to dictionary"""
@@ -226,6 +427,7 @@ class MongoDatabase:
             "orders": OrderModel,
             "customers": CustomerModel,
             "conversations": ConversationModel,
+            "conversation_messages": ConversationMessageModel,
             "products": ProductModel,
             "coupons": CouponModel,
             "delivery_slots": DeliverySlotModel,
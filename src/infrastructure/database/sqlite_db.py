@@ -6,11 +6,19 @@ Async wrapper for aiosqlite + SQLAlchemy
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     AsyncSession,
+    AsyncConnection,
     async_sessionmaker,
     AsyncEngine
 )
+from contextlib import asynccontextmanager
 from pathlib import Path
-from .models import Base, register_sqlite_pragma
+from typing import AsyncIterator
+from .models import (
+    Base,
+    register_sqlite_pragma,
+    create_missing_indexes,
+    merge_duplicate_stock_reservations,
+)
 from ...config import settings
 import logging
 
@@ -31,12 +39,23 @@ class Database:
             db_path = Path(settings.database_url.replace("sqlite+aiosqlite:///", ""))
             db_path.parent.mkdir(parents=True, exist_ok=True)
 
-            # Create async engine
+            # Create async engine. WAL (see register_sqlite_pragma) lets readers
+            # run alongside a writer, so size the pool for concurrent requests.
+            # Pre-ping is skipped: a local SQLite file cannot drop connections.
+            pool_options = {}
+            if ":memory:" not in settings.database_url:
+                pool_options = {
+                    "pool_size": settings.database_pool_size,
+                    "max_overflow": settings.database_max_overflow,
+                    # Fail fast instead of queueing for 30s when the pool is exhausted
+                    "pool_timeout": settings.database_pool_timeout,
+                }
             cls.engine = create_async_engine(
                 settings.database_url,
                 echo=False,  # Set to True for SQL debugging
                 future=True,
-                pool_pre_ping=True,
+                connect_args={"timeout": settings.database_busy_timeout},
+                **pool_options,
             )
 
             # Register SQLite pragmas for better performance
@@ -53,6 +72,10 @@ class Database:
             # Create all tables (checkfirst=True to avoid errors if they exist)
             async with cls.engine.begin() as conn:
                 await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+                # Older databases may hold duplicate reservations that would
+                # make the unique reservation index fail to build
+                await conn.run_sync(merge_duplicate_stock_reservations)
+                await conn.run_sync(create_missing_indexes)
 
             logger.info(f"✅ SQLite database initialized: {settings.database_url}")
 
@@ -90,6 +113,36 @@ class Database:
                 # Ignore close errors if session is in invalid state
                 pass
 
+    @classmethod
+    @asynccontextmanager
+    async def session_scope(cls) -> AsyncIterator[AsyncSession]:
+        """
+        Context-managed session: always closed on exit, rolled back on error.
+        Callers commit explicitly.
+        """
+        if cls.async_session_maker is None:
+            raise RuntimeError("Database not initialized. Call connect() first.")
+
+        async with cls.async_session_maker() as session:
+            try:
+                yield session
+            except Exception:
+                await session.rollback()
+                raise
+
+    @classmethod
+    @asynccontextmanager
+    async def read_scope(cls) -> AsyncIterator[AsyncConnection]:
+        """
+        Core connection for pure reads: no ORM session, identity map or
+        commit. The implicit transaction is simply released on exit.
+        """
+        if cls.engine is None:
+            raise RuntimeError("Database not initialized. Call connect() first.")
+
+        async with cls.engine.connect() as conn:
+            yield conn
+
     @classmethod
     async def execute_query(cls, statement):
         """Execute a raw query and return results"""
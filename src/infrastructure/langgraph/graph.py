@@ -2,7 +2,7 @@
 LangGraph Sales Agent Graph
 Compiles the graph with all nodes and edges
 """
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, Optional
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 from .state import AgentState
@@ -150,6 +150,10 @@ def create_sales_graph() -> StateGraph:
     return graph
 
 
+# Nodes whose LLM output is the reply shown to the customer
+STREAMED_NODES = ("sales_agent", "reverse_logistics_agent")
+
+
 class SalesGraph:
     """
     Wrapper class for the Sales Agent Graph
@@ -208,13 +212,13 @@ class SalesGraph:
             "reasoning_trace": []
         }
     
-    async def process_message(
+    async def _prepare_input(
         self,
         conversation_id: str,
         message: str,
-        user_id: str = "guest"
-    ) -> Dict[str, Any]:
-        """Process a user message through the graph"""
+        user_id: str
+    ) -> tuple:
+        """Build the graph input and config for a new user message"""
         from datetime import datetime
         
         # Create user message
@@ -266,10 +270,10 @@ class SalesGraph:
             "next_node": "context_injector",
             "error": None
         }
-        
-        # Run graph
-        result = await self.app.ainvoke(input_state, config)
-        
+        return input_state, config
+    
+    def _format_result(self, conversation_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape the final graph state into the API response dict"""
         # Check if interrupted for human intervention
         if result.get("requires_human"):
             return {
@@ -299,6 +303,45 @@ class SalesGraph:
             "conversation_stage": result.get("conversation_stage", "discovery")
         }
     
+    async def process_message(
+        self,
+        conversation_id: str,
+        message: str,
+        user_id: str = "guest"
+    ) -> Dict[str, Any]:
+        """Process a user message through the graph"""
+        input_state, config = await self._prepare_input(conversation_id, message, user_id)
+        
+        # Run graph
+        result = await self.app.ainvoke(input_state, config)
+        return self._format_result(conversation_id, result)
+    
+    async def stream_message(
+        self,
+        conversation_id: str,
+        message: str,
+        user_id: str = "guest"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process a user message, yielding the agent's reply tokens as they are
+        generated ({"type": "token"}) and then the same result dict as
+        process_message ({"type": "done"}).
+        """
+        input_state, config = await self._prepare_input(conversation_id, message, user_id)
+        
+        async for event in self.app.astream_events(input_state, config, version="v2"):
+            if event["event"] != "on_chat_model_stream":
+                continue
+            # Only the customer-facing agents; skip classifier/summarizer LLM calls
+            if event.get("metadata", {}).get("langgraph_node") not in STREAMED_NODES:
+                continue
+            content = event["data"]["chunk"].content
+            if content:
+                yield {"type": "token", "content": content}
+        
+        state = await self.app.aget_state(config)
+        yield {"type": "done", **self._format_result(conversation_id, state.values)}
+    
     async def handle_human_response(
         self,
         conversation_id: str,
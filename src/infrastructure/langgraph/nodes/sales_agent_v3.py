@@ -802,7 +802,7 @@ async def add_to_cart(product_id: str, quantity: int = 1) -> str:
         if not result.get("success"):
             return json.dumps(result)
         
-        cart = await stock_service.get_cart_total(conversation_id)
+        cart = await stock_service.get_cart_summary(conversation_id)
         
         return json.dumps({
             "success": True,
@@ -840,7 +840,7 @@ async def remove_from_cart(product_id: str, quantity: Optional[int] = None) -> s
         )
         
         if result.get("success"):
-            cart = await stock_service.get_cart_total(conversation_id)
+            cart = await stock_service.get_cart_summary(conversation_id)
             result["cart_total"] = cart["total"]
             result["cart_items"] = cart["item_count"]
         
@@ -1995,8 +1995,8 @@ async def apply_coupon(coupon_code: str) -> str:
         db = MongoDB.get_database()
         stock_service = get_stock_service()
         
-        cart = await stock_service.get_cart_total(conversation_id)
-        if not cart.get("items"):
+        cart = await stock_service.get_cart_summary(conversation_id)
+        if not cart["item_count"]:
             return json.dumps({"success": False, "error": "El carrito esta vacio"})
         
         coupon = await db.coupons.find_one({"code": coupon_code.upper(), "active": True})
@@ -2068,8 +2068,8 @@ async def apply_followup_discount(level: int = 1) -> str:
         db = MongoDB.get_database()
         stock_service = get_stock_service()
         
-        cart = await stock_service.get_cart_total(conversation_id)
-        if not cart.get("items"):
+        cart = await stock_service.get_cart_summary(conversation_id)
+        if not cart["item_count"]:
             return json.dumps({"success": False, "error": "El carrito esta vacio"})
         
         coupon_code = "FOLLOWUP10" if level == 1 else "FOLLOWUP15"
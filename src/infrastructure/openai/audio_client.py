@@ -3,10 +3,40 @@ OpenAI Audio Client - Whisper API
 Handles audio transcription using Whisper model
 """
 import aiohttp
-from typing import Dict, Any, Optional
+from typing import BinaryIO, Dict, Any, Optional, Union
 from ...config import settings
 
 
+# Shared session so OpenAI audio calls (Whisper, TTS) reuse pooled
+# keep-alive connections instead of a new TCP/TLS handshake per request
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Get or create the shared aiohttp session (OpenAI auth header preset)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=50,
+                keepalive_timeout=30,
+                ttl_dns_cache=300
+            ),
+            timeout=aiohttp.ClientTimeout(total=120, connect=5),
+            headers={"Authorization": f"Bearer {settings.openai_api_key}"}
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Close the shared session (called on app shutdown)"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
 class AudioClient:
     """
     HTTP client for OpenAI Whisper API
@@ -19,7 +49,7 @@ class AudioClient:
     
     async def transcribe(
         self,
-        audio_file: bytes,
+        audio_file: Union[bytes, BinaryIO],
         filename: str = "audio.webm",
         language: str = "es",
         model: str = "whisper-1"
@@ -28,7 +58,8 @@ class AudioClient:
         Transcribe audio to text using Whisper API
         
         Args:
-            audio_file: Audio file bytes
+            audio_file: Audio file bytes, or a binary file object (streamed
+                to the API in chunks instead of being read into memory)
             filename: Name of the audio file (with extension)
             language: Language code (es, en, etc.). Use None for auto-detect
             model: Whisper model to use (whisper-1)
@@ -63,24 +94,19 @@ class AudioClient:
         # Response format
         form_data.add_field('response_format', 'verbose_json')
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}"
-        }
-        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, data=form_data, headers=headers) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"Whisper API error: {response.status} - {error_text}")
-                    
-                    result = await response.json()
-                    
-                    return {
-                        "text": result.get("text", ""),
-                        "language": result.get("language"),
-                        "duration": result.get("duration")
-                    }
+            async with get_session().post(url, data=form_data) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    raise Exception(f"Whisper API error: {response.status} - {error_text}")
+                
+                result = await response.json()
+                
+                return {
+                    "text": result.get("text", ""),
+                    "language": result.get("language"),
+                    "duration": result.get("duration")
+                }
         
         except aiohttp.ClientError as e:
             raise Exception(f"Network error calling Whisper API: {str(e)}")
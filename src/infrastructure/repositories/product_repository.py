@@ -1,14 +1,41 @@
 """
 Product repository implementation using SQLAlchemy
 """
-from typing import List, Optional
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, or_
+from sqlalchemy import select, insert, update, or_, case, func, lambda_stmt
 from ...domain.entities import Product
 from ..database.models import ProductModel
 from ..database.sqlite_db import Database
 
 
+@dataclass(slots=True)
+class ProductSummary:
+    """Lightweight product projection for listings (no specifications/metadata)"""
+    id: str
+    name: str
+    description: str
+    category: str
+    price: float
+    stock: int
+    sku: str
+    images: List[str]
+
+
+# Columns loaded for ProductSummary, in constructor order
+_SUMMARY_COLUMNS = (
+    ProductModel.id,
+    ProductModel.name,
+    ProductModel.description,
+    ProductModel.category,
+    ProductModel.price,
+    ProductModel.stock,
+    ProductModel.sku,
+    ProductModel.images,
+)
+
+
 class SQLAlchemyProductRepository:
     """SQLAlchemy implementation of product repository"""
 
@@ -38,14 +65,16 @@ class SQLAlchemyProductRepository:
     async def search(self, query: str, limit: int = 10) -> List[Product]:
         """Search products by name, description, or category"""
         search_term = f"%{query}%"
-        stmt = select(ProductModel).where(
+        # lambda_stmt caches the constructed statement; search_term and limit
+        # are extracted from the closure as bound parameters on each call
+        stmt = lambda_stmt(lambda: select(ProductModel).where(
             or_(
                 ProductModel.name.ilike(search_term),
                 ProductModel.description.ilike(search_term),
                 ProductModel.category.ilike(search_term),
                 ProductModel.sku.ilike(search_term),
             )
-        ).limit(limit)
+        ).limit(limit))
 
         result = await self.session.execute(stmt)
         product_models = result.scalars().all()
@@ -73,22 +102,36 @@ class SQLAlchemyProductRepository:
         return [self._model_to_entity(model) for model in product_models]
 
     async def get_by_ids(self, product_ids: List[str], limit: int = 100) -> List[Product]:
-        """Get products by multiple IDs"""
+        """Get products by multiple IDs, preserving the order of product_ids"""
+        if not product_ids:
+            return []
+
+        order_clause = case(
+            {pid: idx for idx, pid in enumerate(product_ids)},
+            value=ProductModel.id,
+        )
         stmt = select(ProductModel).where(
             ProductModel.id.in_(product_ids)
-        ).limit(limit)
+        ).order_by(order_clause).limit(limit)
 
         result = await self.session.execute(stmt)
-        product_models = result.scalars().all()
-        return [self._model_to_entity(model) for model in product_models]
+        return list(map(self._model_to_entity, result.scalars()))
 
     async def create(self, product: Product) -> Product:
         """Create a new product"""
-        product_model = self._entity_to_model(product)
-        self.session.add(product_model)
-        await self.session.commit()
+        await self.bulk_create([product])
         return product
 
+    async def bulk_create(self, products: List[Product]) -> List[Product]:
+        """Create many products with a single executemany INSERT and one commit"""
+        if not products:
+            return products
+
+        rows = [self._entity_to_row(product) for product in products]
+        await self.session.execute(insert(ProductModel), rows)
+        await self.session.commit()
+        return products
+
     async def update(self, product: Product) -> Product:
         """Update existing product"""
         stmt = select(ProductModel).where(ProductModel.id == product.id)
@@ -98,22 +141,56 @@ class SQLAlchemyProductRepository:
         if not product_model:
             raise ValueError(f"Product {product.id} not found")
 
-        # Update fields
-        for field, value in product.model_dump().items():
-            setattr(product_model, field, value)
-
-        self.session.add(product_model)
+        # Only write columns that actually changed
+        changed = {
+            column: value
+            for column, value in self._entity_to_row(product).items()
+            if getattr(product_model, column) != value
+        }
+        if not changed:
+            return product
+
+        await self.session.execute(
+            update(ProductModel).where(ProductModel.id == product.id).values(**changed)
+        )
         await self.session.commit()
         return product
 
-    async def update_stock(self, product_id: str, quantity: int) -> None:
-        """Update product stock (atomic increment)"""
+    async def update_partial(self, product_id: str, fields: dict) -> Optional[Product]:
+        """
+        Set the given columns with a single UPDATE ... RETURNING (no read
+        first, so no lost-update window). Returns the updated product, or
+        None if it does not exist.
+        """
+        if not fields:
+            return await self.get_by_id(product_id)
+
         stmt = update(ProductModel).where(
             ProductModel.id == product_id
-        ).values(stock=ProductModel.stock + quantity)
+        ).values(**fields).returning(ProductModel)
+
+        result = await self.session.execute(stmt)
+        product_model = result.scalar_one_or_none()
+        await self.session.commit()
+        return self._model_to_entity(product_model) if product_model else None
+
+    async def update_stock(self, product_id: str, quantity: int) -> Optional[int]:
+        """
+        Update product stock (atomic increment/decrement)
+
+        The bounds check runs inside the UPDATE, so concurrent callers cannot
+        drive stock below zero. Returns the new stock, or None if the product
+        does not exist or has insufficient stock.
+        """
+        stmt = update(ProductModel).where(
+            ProductModel.id == product_id,
+            ProductModel.stock + quantity >= 0,
+        ).values(stock=ProductModel.stock + quantity).returning(ProductModel.stock)
 
-        await self.session.execute(stmt)
+        result = await self.session.execute(stmt)
+        new_stock = result.scalar_one_or_none()
         await self.session.commit()
+        return new_stock
 
     async def list_all(self, limit: int = 100) -> List[Product]:
         """List all products"""
@@ -122,6 +199,75 @@ class SQLAlchemyProductRepository:
         product_models = result.scalars().all()
         return [self._model_to_entity(model) for model in product_models]
 
+    async def list_summaries(self, limit: int = 100) -> List[ProductSummary]:
+        """List products, loading only the columns needed for listings"""
+        stmt = select(*_SUMMARY_COLUMNS).limit(limit)
+        result = await self.session.execute(stmt)
+        return self._rows_to_summaries(result)
+
+    async def get_summaries_by_category(self, category: str, limit: int = 10) -> List[ProductSummary]:
+        """Get product summaries by category"""
+        search_term = f"%{category}%"
+        stmt = select(*_SUMMARY_COLUMNS).where(
+            ProductModel.category.ilike(search_term)
+        ).limit(limit)
+
+        result = await self.session.execute(stmt)
+        return self._rows_to_summaries(result)
+
+    async def search_summaries(self, query: str, limit: int = 10) -> List[ProductSummary]:
+        """Search products like search(), returning summaries"""
+        search_term = f"%{query}%"
+        stmt = lambda_stmt(lambda: select(*_SUMMARY_COLUMNS).where(
+            or_(
+                ProductModel.name.ilike(search_term),
+                ProductModel.description.ilike(search_term),
+                ProductModel.category.ilike(search_term),
+                ProductModel.sku.ilike(search_term),
+            )
+        ).limit(limit))
+
+        result = await self.session.execute(stmt)
+        return self._rows_to_summaries(result)
+
+    async def page_summaries(
+        self,
+        offset: int,
+        limit: int,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        after_id: Optional[str] = None
+    ) -> Tuple[List[ProductSummary], int]:
+        """
+        One page of summaries (filtered by category, else by query), ordered
+        by id, and the number of matches. The count comes from COUNT(*) OVER ()
+        on the page query itself, so both cost a single statement.
+
+        With after_id (keyset pagination) the page starts after that id via a
+        primary-key seek, and the count covers only the remaining matches.
+        """
+        stmt = select(*_SUMMARY_COLUMNS, func.count().over())
+        condition = self._summary_filter(query, category)
+        if condition is not None:
+            stmt = stmt.where(condition)
+        if after_id is not None:
+            stmt = stmt.where(ProductModel.id > after_id)
+        stmt = stmt.order_by(ProductModel.id).offset(offset).limit(limit)
+
+        rows = (await self.session.execute(stmt)).all()
+        if rows:
+            return [ProductSummary(*row[:-1]) for row in rows], rows[0][-1]
+        # Past the last page: the window has no rows to report the total on
+        return [], await self.count(query, category) if offset else 0
+
+    async def count(self, query: Optional[str] = None, category: Optional[str] = None) -> int:
+        """Count products matching the same filters as page_summaries()"""
+        stmt = select(func.count()).select_from(ProductModel)
+        condition = self._summary_filter(query, category)
+        if condition is not None:
+            stmt = stmt.where(condition)
+        return (await self.session.execute(stmt)).scalar_one()
+
     async def delete(self, product_id: str) -> bool:
         """Delete a product"""
         product = await self.get_by_id(product_id)
@@ -148,21 +294,46 @@ class SQLAlchemyProductRepository:
             metadata=model.meta_data or {},
         )
 
+    @staticmethod
+    def _summary_filter(query: Optional[str], category: Optional[str]):
+        """WHERE clause for listing filters (category wins over query), or None"""
+        if category:
+            return ProductModel.category.ilike(f"%{category}%")
+        if query:
+            search_term = f"%{query}%"
+            return or_(
+                ProductModel.name.ilike(search_term),
+                ProductModel.description.ilike(search_term),
+                ProductModel.category.ilike(search_term),
+                ProductModel.sku.ilike(search_term),
+            )
+        return None
+
+    @staticmethod
+    def _rows_to_summaries(result) -> List[ProductSummary]:
+        """Convert projected rows to summaries"""
+        return [ProductSummary(*row) for row in result]
+
     @staticmethod
     def _entity_to_model(entity: Product) -> ProductModel:
         """Convert domain entity to SQLAlchemy model"""
-        return ProductModel(
-            id=entity.id,
-            name=entity.name,
-            description=entity.description,
-            category=entity.category,
-            price=entity.price,
-            stock=entity.stock,
-            sku=entity.sku,
-            images=entity.images,
-            specifications=entity.specifications,
-            meta_data=entity.metadata,
-        )
+        return ProductModel(**SQLAlchemyProductRepository._entity_to_row(entity))
+
+    @staticmethod
+    def _entity_to_row(entity: Product) -> dict:
+        """Convert domain entity to a column -> value mapping for INSERT"""
+        return {
+            "id": entity.id,
+            "name": entity.name,
+            "description": entity.description,
+            "category": entity.category,
+            "price": entity.price,
+            "stock": entity.stock,
+            "sku": entity.sku,
+            "images": entity.images,
+            "specifications": entity.specifications,
+            "meta_data": entity.metadata,
+        }
 
 
 class MongoProductRepository:
@@ -241,6 +412,53 @@ class MongoProductRepository:
         finally:
             await session.close()
 
+    async def list_summaries(self, limit: int = 100) -> List[ProductSummary]:
+        """List product summaries"""
+        repo, session = await self._get_repo()
+        try:
+            return await repo.list_summaries(limit)
+        finally:
+            await session.close()
+
+    async def get_summaries_by_category(self, category: str, limit: int = 10) -> List[ProductSummary]:
+        """Get product summaries by category"""
+        repo, session = await self._get_repo()
+        try:
+            return await repo.get_summaries_by_category(category, limit)
+        finally:
+            await session.close()
+
+    async def search_summaries(self, query: str, limit: int = 10) -> List[ProductSummary]:
+        """Search product summaries"""
+        repo, session = await self._get_repo()
+        try:
+            return await repo.search_summaries(query, limit)
+        finally:
+            await session.close()
+
+    async def page_summaries(
+        self,
+        offset: int,
+        limit: int,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        after_id: Optional[str] = None
+    ) -> Tuple[List[ProductSummary], int]:
+        """Get one page of product summaries and the match count"""
+        repo, session = await self._get_repo()
+        try:
+            return await repo.page_summaries(offset, limit, query, category, after_id)
+        finally:
+            await session.close()
+
+    async def count(self, query: Optional[str] = None, category: Optional[str] = None) -> int:
+        """Count matching products"""
+        repo, session = await self._get_repo()
+        try:
+            return await repo.count(query, category)
+        finally:
+            await session.close()
+
     async def create(self, product: Product) -> Product:
         """Create a new product"""
         repo, session = await self._get_repo()
@@ -249,6 +467,14 @@ class MongoProductRepository:
         finally:
             await session.close()
 
+    async def bulk_create(self, products: List[Product]) -> List[Product]:
+        """Create many products in one batch"""
+        repo, session = await self._get_repo()
+        try:
+            return await repo.bulk_create(products)
+        finally:
+            await session.close()
+
     async def update(self, product: Product) -> Product:
         """Update existing product"""
         repo, session = await self._get_repo()
@@ -257,11 +483,19 @@ class MongoProductRepository:
         finally:
             await session.close()
 
-    async def update_stock(self, product_id: str, quantity: int) -> None:
+    async def update_partial(self, product_id: str, fields: dict) -> Optional[Product]:
+        """Update the given columns of a product"""
+        repo, session = await self._get_repo()
+        try:
+            return await repo.update_partial(product_id, fields)
+        finally:
+            await session.close()
+
+    async def update_stock(self, product_id: str, quantity: int) -> Optional[int]:
         """Update product stock"""
         repo, session = await self._get_repo()
         try:
-            await repo.update_stock(product_id, quantity)
+            return await repo.update_stock(product_id, quantity)
         finally:
             await session.close()
 
@@ -1,6 +1,7 @@
 """
 District matching service using Pinecone semantic search
 """
+import re
 from typing import Optional, List, Dict
 from ..database.mongodb import MongoDB
 from ...domain.repositories import IVectorStoreRepository
@@ -12,7 +13,17 @@ class DistrictMatcher:
     """Match user input to district names using Pinecone semantic similarity"""
     
     _districts_cache = None
+    _district_regex = None  # Single alternation over all names and aliases
+    _alias_map = None  # Lowercased pattern -> canonical district name
     _openai_client = None
+
+    # Common abbreviations: canonical lowercased name -> extra patterns
+    _ALIASES = {
+        "miraflores": ("mira",),
+        "san isidro": ("isidro",),
+        "surco": ("santiago",),
+        "la molina": ("molina",),
+    }
     
     @classmethod
     def get_openai_client(cls):
@@ -27,8 +38,43 @@ class DistrictMatcher:
         if cls._districts_cache is None:
             db = MongoDB.get_database()
             cls._districts_cache = await db.districts.find().to_list(length=None)
+            cls._build_matcher(cls._districts_cache)
         return cls._districts_cache
-    
+
+    @classmethod
+    def _build_matcher(cls, districts: List[Dict]) -> None:
+        """
+        Precompile one regex over every district name, its "San"-less
+        variant and known abbreviations, plus a map back to the canonical name.
+        """
+        alias_map: Dict[str, str] = {}
+        for district in districts:
+            name = district.get('name', '')
+            name_lower = name.lower()
+            if not name_lower:
+                continue
+
+            alias_map.setdefault(name_lower, name)
+
+            # Without "San" prefix
+            if name_lower.startswith("san "):
+                alias_map.setdefault(name_lower.replace("san ", ""), name)
+
+            for alias in cls._ALIASES.get(name_lower, ()):
+                alias_map.setdefault(alias, name)
+
+        cls._alias_map = alias_map
+        if not alias_map:
+            cls._district_regex = None
+            return
+
+        # Longest first so "san isidro" wins over "isidro" at the same position
+        patterns = sorted(alias_map, key=len, reverse=True)
+        cls._district_regex = re.compile(
+            r"\b(" + "|".join(map(re.escape, patterns)) + r")\b",
+            re.IGNORECASE
+        )
+
     @classmethod
     async def find_district_in_text(cls, text: str) -> Optional[str]:
         """
@@ -44,35 +90,9 @@ class DistrictMatcher:
         if not text:
             return None
         
-        text_lower = text.lower()
-        districts = await cls.get_districts()
-        
-        if not districts:
+        await cls.get_districts()
+        if cls._district_regex is None:
             return None
         
-        # Try exact match first
-        for district in districts:
-            name = district.get('name', '')
-            name_lower = name.lower()
-            
-            # Check for exact match
-            if name_lower in text_lower:
-                return name
-            
-            # Check without "San" prefix
-            if name_lower.startswith("san "):
-                name_without_san = name_lower.replace("san ", "")
-                if name_without_san in text_lower:
-                    return name
-            
-            # Check for common abbreviations
-            if name_lower == "miraflores" and "mira" in text_lower:
-                return name
-            elif name_lower == "san isidro" and "isidro" in text_lower:
-                return name
-            elif name_lower == "surco" and ("surco" in text_lower or "santiago" in text_lower):
-                return name
-            elif name_lower == "la molina" and "molina" in text_lower:
-                return name
-        
-        return None
+        match = cls._district_regex.search(text)
+        return cls._alias_map[match.group(1).lower()] if match else None
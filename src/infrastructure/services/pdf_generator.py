@@ -7,11 +7,122 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import BinaryIO, Optional, Union
+import asyncio
+import io
 import uuid
 import os
 
 
+# ============================================================================
+# Static template parts (built once per process, reused for every PDF)
+# ============================================================================
+
+_STYLES = getSampleStyleSheet()
+
+_TITLE_STYLE = ParagraphStyle(
+    'CustomTitle',
+    parent=_STYLES['Heading1'],
+    fontSize=24,
+    textColor=colors.HexColor('#1e40af'),
+    spaceAfter=30,
+    alignment=TA_CENTER
+)
+
+_HEADING_STYLE = ParagraphStyle(
+    'CustomHeading',
+    parent=_STYLES['Heading2'],
+    fontSize=14,
+    textColor=colors.HexColor('#1e40af'),
+    spaceAfter=12,
+    spaceBefore=12
+)
+
+_FOOTER_STYLE = ParagraphStyle(
+    'Footer',
+    parent=_STYLES['Normal'],
+    fontSize=9,
+    textColor=colors.HexColor('#6b7280'),
+    alignment=TA_CENTER
+)
+
+_COMPANY_TABLE_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#374151')),
+    ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+_CUSTOMER_TABLE_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#374151')),
+    ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+_PRODUCTS_HEADER = ['#', 'Producto', 'Cantidad', 'Precio Unit.', 'Subtotal']
+
+_PRODUCTS_TABLE_STYLE = TableStyle([
+    # Header
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 11),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+    # Body
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor('#374151')),
+    ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+    ('ALIGN', (2, 1), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 10),
+    ('TOPPADDING', (0, 1), (-1, -1), 8),
+    ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+
+    # Grid
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#d1d5db')),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
+])
+
+_SUMMARY_TABLE_STYLE = TableStyle([
+    ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+    ('FONTSIZE', (0, 0), (-1, -1), 11),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#374151')),
+    ('LINEABOVE', (1, 2), (-1, 2), 2, colors.HexColor('#1e40af')),
+    ('TOPPADDING', (0, 0), (-1, -1), 8),
+])
+
+_TERMS = (
+    "1. Esta orden de compra es válida por 7 días a partir de la fecha de emisión.",
+    "2. Los precios incluyen IVA y están sujetos a cambios sin previo aviso.",
+    "3. El pago debe realizarse antes de la entrega de los productos.",
+    "4. Métodos de pago aceptados: Transferencia bancaria, tarjeta de crédito/débito.",
+    "5. Tiempo estimado de entrega: 3-5 días hábiles después de confirmar el pago.",
+    "6. Los productos pueden ser devueltos dentro de 30 días con el recibo original.",
+    "7. La garantía de los productos varía según el fabricante (consultar detalles).",
+    "8. Para cualquier consulta, contactar a nuestro servicio al cliente."
+)
+
+_FOOTER_TEXT = "Gracias por su preferencia | www.tiendahogar.com | ventas@tiendahogar.com"
+
+# Worker pool for CPU-bound PDF rendering (created lazily on first use)
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Get or create the PDF rendering process pool"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _pdf_pool
+
+
 class PDFGenerator:
     """Generate professional purchase order PDFs"""
     
@@ -35,12 +146,34 @@ class PDFGenerator:
             pdf_dir = os.path.join(os.getcwd(), 'pdfs')
             os.makedirs(pdf_dir, exist_ok=True)
             
-            order_id = order_data.get('order_id', str(uuid.uuid4())[:8])
-            output_path = os.path.join(pdf_dir, f'orden_{order_id}.pdf')
+            output_path = os.path.join(pdf_dir, PDFGenerator.get_filename(order_data))
+        
+        PDFGenerator._build(order_data, output_path)
         
+        return output_path
+
+    @staticmethod
+    def generate_purchase_order_bytes(order_data: dict) -> bytes:
+        """
+        Generate a purchase order PDF in memory, skipping the filesystem.
+        Use get_filename() for a matching download name.
+        """
+        buffer = io.BytesIO()
+        PDFGenerator._build(order_data, buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def get_filename(order_data: dict) -> str:
+        """Get the PDF filename for an order"""
+        order_id = order_data.get('order_id', str(uuid.uuid4())[:8])
+        return f'orden_{order_id}.pdf'
+
+    @staticmethod
+    def _build(order_data: dict, output: Union[str, BinaryIO]) -> None:
+        """Render the purchase order into a file path or binary buffer"""
         # Create PDF
         doc = SimpleDocTemplate(
-            output_path,
+            output,
             pagesize=letter,
             rightMargin=72,
             leftMargin=72,
@@ -50,29 +183,9 @@ class PDFGenerator:
         
         # Container for elements
         story = []
-        styles = getSampleStyleSheet()
-        
-        # Custom styles
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontSize=24,
-            textColor=colors.HexColor('#1e40af'),
-            spaceAfter=30,
-            alignment=TA_CENTER
-        )
-        
-        heading_style = ParagraphStyle(
-            'CustomHeading',
-            parent=styles['Heading2'],
-            fontSize=14,
-            textColor=colors.HexColor('#1e40af'),
-            spaceAfter=12,
-            spaceBefore=12
-        )
         
         # Title
-        story.append(Paragraph("ORDEN DE COMPRA", title_style))
+        story.append(Paragraph("ORDEN DE COMPRA", _TITLE_STYLE))
         story.append(Spacer(1, 12))
         
         # Company Info
@@ -84,21 +197,14 @@ class PDFGenerator:
         ]
         
         company_table = Table(company_info, colWidths=[3*inch, 3*inch])
-        company_table.setStyle(TableStyle([
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('TEXTCOLOR', (0, 0), (0, -1), colors.HexColor('#374151')),
-            ('TEXTCOLOR', (1, 0), (1, -1), colors.HexColor('#374151')),
-            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
+        company_table.setStyle(_COMPANY_TABLE_STYLE)
         
         story.append(company_table)
         story.append(Spacer(1, 20))
         
         # Customer Info (if available)
         if order_data.get('customer_name'):
-            story.append(Paragraph("<b>DATOS DEL CLIENTE</b>", heading_style))
+            story.append(Paragraph("<b>DATOS DEL CLIENTE</b>", _HEADING_STYLE))
             customer_data = [
                 ["Nombre:", order_data.get('customer_name', 'N/A')],
                 ["Dirección:", order_data.get('customer_address', 'N/A')],
@@ -107,61 +213,32 @@ class PDFGenerator:
                 ["Email:", order_data.get('customer_email', 'N/A') or 'No proporcionado'],
             ]
             customer_table = Table(customer_data, colWidths=[1.5*inch, 4.5*inch])
-            customer_table.setStyle(TableStyle([
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#374151')),
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ]))
+            customer_table.setStyle(_CUSTOMER_TABLE_STYLE)
             story.append(customer_table)
             story.append(Spacer(1, 20))
         
         # Products Table
-        story.append(Paragraph("<b>DETALLE DE PRODUCTOS</b>", heading_style))
-        
-        # Table header
-        products_data = [
-            ['#', 'Producto', 'Cantidad', 'Precio Unit.', 'Subtotal']
-        ]
+        story.append(Paragraph("<b>DETALLE DE PRODUCTOS</b>", _HEADING_STYLE))
         
-        # Add products
-        for idx, item in enumerate(order_data.get('items', []), 1):
-            products_data.append([
+        # Header + product rows
+        money = "${:.2f}".format
+        products_data = [_PRODUCTS_HEADER, *[
+            [
                 str(idx),
                 item.get('name', 'N/A'),
                 str(item.get('quantity', 0)),
-                f"${item.get('price', 0):.2f}",
-                f"${item.get('subtotal', 0):.2f}"
-            ])
+                money(item.get('price', 0)),
+                money(item.get('subtotal', 0))
+            ]
+            for idx, item in enumerate(order_data.get('items', []), 1)
+        ]]
         
         products_table = Table(
             products_data,
             colWidths=[0.5*inch, 3*inch, 1*inch, 1.25*inch, 1.25*inch]
         )
         
-        products_table.setStyle(TableStyle([
-            # Header
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e40af')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 11),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            
-            # Body
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.HexColor('#374151')),
-            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
-            ('ALIGN', (2, 1), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 10),
-            ('TOPPADDING', (0, 1), (-1, -1), 8),
-            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-            
-            # Grid
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#d1d5db')),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9fafb')]),
-        ]))
+        products_table.setStyle(_PRODUCTS_TABLE_STYLE)
         
         story.append(products_table)
         story.append(Spacer(1, 20))
@@ -175,52 +252,49 @@ class PDFGenerator:
         ]
         
         summary_table = Table(summary_data, colWidths=[3*inch, 2*inch, 1*inch])
-        summary_table.setStyle(TableStyle([
-            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.HexColor('#374151')),
-            ('LINEABOVE', (1, 2), (-1, 2), 2, colors.HexColor('#1e40af')),
-            ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ]))
+        summary_table.setStyle(_SUMMARY_TABLE_STYLE)
         
         story.append(summary_table)
         story.append(Spacer(1, 30))
         
         # Terms and Conditions
-        story.append(Paragraph("<b>TÉRMINOS Y CONDICIONES</b>", heading_style))
-        
-        terms = [
-            "1. Esta orden de compra es válida por 7 días a partir de la fecha de emisión.",
-            "2. Los precios incluyen IVA y están sujetos a cambios sin previo aviso.",
-            "3. El pago debe realizarse antes de la entrega de los productos.",
-            "4. Métodos de pago aceptados: Transferencia bancaria, tarjeta de crédito/débito.",
-            "5. Tiempo estimado de entrega: 3-5 días hábiles después de confirmar el pago.",
-            "6. Los productos pueden ser devueltos dentro de 30 días con el recibo original.",
-            "7. La garantía de los productos varía según el fabricante (consultar detalles).",
-            "8. Para cualquier consulta, contactar a nuestro servicio al cliente."
-        ]
+        story.append(Paragraph("<b>TÉRMINOS Y CONDICIONES</b>", _HEADING_STYLE))
         
-        for term in terms:
-            story.append(Paragraph(term, styles['Normal']))
+        for term in _TERMS:
+            story.append(Paragraph(term, _STYLES['Normal']))
             story.append(Spacer(1, 6))
         
         story.append(Spacer(1, 20))
         
         # Footer
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=9,
-            textColor=colors.HexColor('#6b7280'),
-            alignment=TA_CENTER
-        )
-        
-        story.append(Paragraph(
-            "Gracias por su preferencia | www.tiendahogar.com | ventas@tiendahogar.com",
-            footer_style
-        ))
+        story.append(Paragraph(_FOOTER_TEXT, _FOOTER_STYLE))
         
         # Build PDF
         doc.build(story)
-        
-        return output_path
+
+    @staticmethod
+    async def generate_purchase_order_async(
+        order_data: dict,
+        output_path: str = None
+    ) -> str:
+        """
+        Generate a purchase order PDF without blocking the event loop.
+        Rendering runs in a worker process, so order_data must be picklable.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_pdf_pool(),
+            PDFGenerator.generate_purchase_order,
+            order_data,
+            output_path
+        )
+
+    @staticmethod
+    async def generate_purchase_order_bytes_async(order_data: dict) -> bytes:
+        """In-memory variant of generate_purchase_order_async"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_pdf_pool(),
+            PDFGenerator.generate_purchase_order_bytes,
+            order_data
+        )
@@ -4,17 +4,35 @@ Manages temporary stock reservations with 15-minute TTL
 Uses SQLAlchemy instead of MongoDB
 """
 import asyncio
+import logging
+import os
+import secrets
+import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from sqlalchemy import select, delete, func
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Coroutine, Dict, List, Optional, Set, Tuple
+from sqlalchemy import (
+    select, insert, update, delete, func, case, and_, lambda_stmt, literal, DateTime
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased, selectinload
 
 from ..database.sqlite_db import Database
 from ..database.models import (
     StockReservationModel, ProductModel, OrderModel, OrderItemModel
 )
 
+logger = logging.getLogger(__name__)
+
+
+def _new_ids(count: int) -> List[str]:
+    """Generate `count` UUID4 strings from a single urandom read"""
+    raw = os.urandom(16 * count)
+    return [
+        str(uuid.UUID(bytes=raw[i:i + 16], version=4))
+        for i in range(0, len(raw), 16)
+    ]
+
 
 class StockReservationService:
     """
@@ -23,14 +41,41 @@ class StockReservationService:
     """
 
     RESERVATION_TTL_MINUTES = 15
+    AVAILABLE_STOCK_CACHE_TTL_SECONDS = 3
+    # Reads already filter on expires_at, so the sweep is housekeeping only
+    CLEANUP_MIN_INTERVAL_SECONDS = 30
+    CLEANUP_MAX_INTERVAL_SECONDS = 300
+    CLEANUP_BATCH_SIZE = 500
 
     def __init__(self):
         self._cleanup_task: Optional[asyncio.Task] = None
-
-    async def _get_session(self) -> AsyncSession:
-        """Get a database session"""
-        session_gen = Database.get_session()
-        return await anext(session_gen)
+        self._next_expiry: Optional[datetime] = None
+        self._cleanup_wakeup = asyncio.Event()
+        # Strong references so fire-and-forget tasks are not garbage collected
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._sweep_task: Optional[asyncio.Task] = None
+        # product_id -> (available stock, monotonic expiry)
+        self._available_cache: Dict[str, Tuple[int, float]] = {}
+
+    def _invalidate_available(self, *product_ids: str) -> None:
+        """Drop cached availability for the given products (all if none given)"""
+        if not product_ids:
+            self._available_cache.clear()
+            return
+        for product_id in product_ids:
+            self._available_cache.pop(product_id, None)
+
+    def _spawn(self, coro: Coroutine) -> asyncio.Task:
+        """Run a coroutine in the background, holding a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def _trigger_sweep(self) -> None:
+        """Release expired reservations off the request path (one sweep at a time)"""
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = self._spawn(self.release_expired_reservations())
 
     async def start_cleanup_task(self):
         """Start background task to clean up expired reservations"""
@@ -38,15 +83,50 @@ class StockReservationService:
             self._cleanup_task = asyncio.create_task(self._cleanup_loop())
 
     async def _cleanup_loop(self):
-        """Background loop to release expired reservations"""
+        """
+        Background loop to release expired reservations.
+        Sleeps until the next known expiry (bounded by the min/max interval);
+        a reservation that expires sooner wakes it early.
+        """
         while True:
             try:
                 await self.release_expired_reservations()
-                await asyncio.sleep(30)  # Check every 30 seconds
+                self._next_expiry = await self._get_next_expiry()
+
+                self._cleanup_wakeup.clear()
+                try:
+                    await asyncio.wait_for(
+                        self._cleanup_wakeup.wait(),
+                        timeout=self._seconds_until_next_sweep()
+                    )
+                except asyncio.TimeoutError:
+                    pass
             except Exception as e:
-                print(f"Error in reservation cleanup: {e}")
+                logger.warning("Error in reservation cleanup: %s", e)
                 await asyncio.sleep(60)
 
+    def _seconds_until_next_sweep(self) -> float:
+        """Delay until the next sweep, clamped to the configured interval"""
+        if self._next_expiry is None:
+            return self.CLEANUP_MAX_INTERVAL_SECONDS
+        delay = (self._next_expiry - datetime.utcnow()).total_seconds()
+        return min(
+            max(delay, self.CLEANUP_MIN_INTERVAL_SECONDS),
+            self.CLEANUP_MAX_INTERVAL_SECONDS
+        )
+
+    def _schedule_expiry(self, expires_at: datetime) -> None:
+        """Record a new reservation expiry, waking the sweeper if it is sooner"""
+        if self._next_expiry is None or expires_at < self._next_expiry:
+            self._next_expiry = expires_at
+            self._cleanup_wakeup.set()
+
+    async def _get_next_expiry(self) -> Optional[datetime]:
+        """Earliest pending reservation expiry (index-only lookup)"""
+        async with Database.read_scope() as conn:
+            result = await conn.execute(select(func.min(StockReservationModel.expires_at)))
+            return result.scalar()
+
     async def reserve_stock(
         self,
         conversation_id: str,
@@ -57,115 +137,160 @@ class StockReservationService:
         """
         Reserve stock for a product temporarily.
         """
-        session = await self._get_session()
-        try:
-            # Check available stock
-            product_stmt = select(ProductModel).where(ProductModel.id == product_id)
-            result = await session.execute(product_stmt)
-            product = result.scalar_one_or_none()
-
-            if not product:
+        async with Database.session_scope() as session:
+            now = datetime.utcnow()
+
+            # One query: product stock/name and unexpired quantity reserved by
+            # other conversations and by this one
+            stmt = lambda_stmt(lambda: select(
+                ProductModel.stock,
+                ProductModel.name,
+                func.coalesce(func.sum(case(
+                    (and_(StockReservationModel.conversation_id != conversation_id,
+                          StockReservationModel.expires_at > now),
+                     StockReservationModel.quantity),
+                    else_=0
+                )), 0).label("reserved_by_others"),
+                func.coalesce(func.sum(case(
+                    (and_(StockReservationModel.conversation_id == conversation_id,
+                          StockReservationModel.expires_at > now),
+                     StockReservationModel.quantity),
+                    else_=0
+                )), 0).label("reserved_by_me"),
+                func.max(case(
+                    (StockReservationModel.expires_at <= now, 1), else_=0
+                )).label("has_expired"),
+            ).outerjoin(
+                StockReservationModel, StockReservationModel.product_id == ProductModel.id
+            ).where(
+                ProductModel.id == product_id
+            ).group_by(ProductModel.id))
+            row = (await session.execute(stmt)).one_or_none()
+
+            if row is None:
                 return {"success": False, "error": "Producto no encontrado"}
 
-            total_stock = product.stock or 0
+            if row.has_expired:
+                self._trigger_sweep()
 
-            # Get total reserved for this product (excluding current conversation)
-            reserved_stmt = select(func.sum(StockReservationModel.quantity)).where(
-                StockReservationModel.product_id == product_id,
-                StockReservationModel.conversation_id != conversation_id,
-                StockReservationModel.expires_at > datetime.utcnow()
-            )
-            reserved_result = await session.execute(reserved_stmt)
-            total_reserved = reserved_result.scalar() or 0
-            available_stock = total_stock - total_reserved
+            available_stock = (row.stock or 0) - row.reserved_by_others - row.reserved_by_me
 
             if quantity > available_stock:
-                return {
-                    "success": False,
-                    "error": f"Stock insuficiente. Disponible: {available_stock}, Solicitado: {quantity}",
-                    "available_stock": available_stock
-                }
+                return self._insufficient_stock(available_stock, quantity)
 
-            # Check if reservation already exists
-            existing_stmt = select(StockReservationModel).where(
-                StockReservationModel.conversation_id == conversation_id,
-                StockReservationModel.product_id == product_id
+            expires_at = now + timedelta(minutes=self.RESERVATION_TTL_MINUTES)
+            reserved_quantity = await self._upsert_reservation(
+                session, conversation_id, product_id, quantity, now, expires_at
             )
-            existing_result = await session.execute(existing_stmt)
-            existing = existing_result.scalar_one_or_none()
-
-            expires_at = datetime.utcnow() + timedelta(minutes=self.RESERVATION_TTL_MINUTES)
-
-            if existing:
-                # Update existing reservation
-                new_quantity = existing.quantity + quantity
-                if new_quantity > available_stock + existing.quantity:
-                    return {
-                        "success": False,
-                        "error": "Stock insuficiente para cantidad total",
-                        "available_stock": available_stock + existing.quantity
-                    }
-                existing.quantity = new_quantity
-                existing.expires_at = expires_at
-                reserved_quantity = new_quantity
-            else:
-                # Create new reservation
-                reservation = StockReservationModel(
-                    id=str(uuid.uuid4()),
-                    conversation_id=conversation_id,
-                    product_id=product_id,
-                    quantity=quantity,
-                    expires_at=expires_at,
-                    created_at=datetime.utcnow()
+            if reserved_quantity is None:
+                # Another conversation reserved the stock since the read above
+                await session.rollback()
+                self._invalidate_available(product_id)
+                return self._insufficient_stock(
+                    await self.get_available_stock(product_id), quantity
                 )
-                session.add(reservation)
-                reserved_quantity = quantity
 
             await session.commit()
+            self._invalidate_available(product_id)
+            self._schedule_expiry(expires_at)
 
             return {
                 "success": True,
                 "product_id": product_id,
-                "product_name": product.name,
+                "product_name": row.name,
                 "reserved_quantity": reserved_quantity,
                 "expires_at": expires_at.isoformat(),
                 "available_stock": available_stock - quantity
             }
-        finally:
-            await session.close()
+
+    @staticmethod
+    def _insufficient_stock(available_stock: int, quantity: int) -> Dict:
+        return {
+            "success": False,
+            "error": f"Stock insuficiente. Disponible: {available_stock}, Solicitado: {quantity}",
+            "available_stock": available_stock
+        }
+
+    @staticmethod
+    async def _upsert_reservation(
+        session,
+        conversation_id: str,
+        product_id: str,
+        quantity: int,
+        now: datetime,
+        expires_at: datetime
+    ) -> Optional[int]:
+        """
+        Insert or grow this conversation's reservation in one statement that
+        also enforces the stock bound, so concurrent reservations cannot
+        oversell. An own reservation that expired but was not swept yet is
+        reset rather than grown. Returns the reserved quantity, or None if
+        the stock bound rejected the write.
+        """
+        others = aliased(StockReservationModel)
+        held_by_others = select(func.coalesce(func.sum(others.quantity), 0)).where(
+            others.product_id == product_id,
+            others.conversation_id != conversation_id,
+            others.expires_at > now,
+        ).scalar_subquery()
+        stock = select(ProductModel.stock).where(ProductModel.id == product_id).scalar_subquery()
+        available = func.coalesce(stock, 0) - held_by_others
+
+        upsert_stmt = sqlite_insert(StockReservationModel).from_select(
+            ["id", "conversation_id", "product_id", "quantity", "expires_at", "created_at"],
+            select(
+                literal(str(uuid.uuid4())),
+                literal(conversation_id),
+                literal(product_id),
+                literal(quantity),
+                literal(expires_at, DateTime),
+                literal(now, DateTime),
+            ).where(literal(quantity) <= available)
+        )
+        new_quantity = case(
+            (StockReservationModel.expires_at <= now, upsert_stmt.excluded.quantity),
+            else_=StockReservationModel.quantity + upsert_stmt.excluded.quantity,
+        )
+        upsert_stmt = upsert_stmt.on_conflict_do_update(
+            index_elements=["conversation_id", "product_id"],
+            set_={"quantity": new_quantity, "expires_at": upsert_stmt.excluded.expires_at},
+            where=new_quantity <= available,
+        ).returning(StockReservationModel.quantity)
+        return (await session.execute(upsert_stmt)).scalar_one_or_none()
 
     async def get_cart(self, conversation_id: str) -> List[Dict]:
         """Get all reservations (cart items) for a conversation"""
-        session = await self._get_session()
-        try:
-            stmt = select(StockReservationModel).where(
+        now = datetime.utcnow()
+        async with Database.read_scope() as conn:
+            stmt = lambda_stmt(lambda: select(
+                StockReservationModel.product_id,
+                StockReservationModel.quantity,
+                StockReservationModel.expires_at,
+                ProductModel.name,
+                ProductModel.price,
+                (ProductModel.price * StockReservationModel.quantity).label("subtotal"),
+                # First image only; skips decoding the whole images array
+                func.json_extract(ProductModel.images, "$[0]").label("image_key"),
+            ).join(
+                ProductModel, ProductModel.id == StockReservationModel.product_id
+            ).where(
                 StockReservationModel.conversation_id == conversation_id,
-                StockReservationModel.expires_at > datetime.utcnow()
-            )
-            result = await session.execute(stmt)
-            reservations = result.scalars().all()
-
-            cart_items = []
-            for res in reservations:
-                # Get product info
-                product_stmt = select(ProductModel).where(ProductModel.id == res.product_id)
-                product_result = await session.execute(product_stmt)
-                product = product_result.scalar_one_or_none()
-
-                if product:
-                    cart_items.append({
-                        "product_id": res.product_id,
-                        "product_name": product.name,
-                        "quantity": res.quantity,
-                        "price": product.price,
-                        "subtotal": product.price * res.quantity,
-                        "image_key": product.images[0] if product.images else None,
-                        "expires_at": res.expires_at.isoformat()
-                    })
-
-            return cart_items
-        finally:
-            await session.close()
+                StockReservationModel.expires_at > now
+            ))
+            result = await conn.execute(stmt)
+
+            return [
+                {
+                    "product_id": row.product_id,
+                    "product_name": row.name,
+                    "quantity": row.quantity,
+                    "price": row.price,
+                    "subtotal": row.subtotal,
+                    "image_key": row.image_key,
+                    "expires_at": row.expires_at.isoformat()
+                }
+                for row in result
+            ]
 
     async def get_cart_total(self, conversation_id: str) -> Dict:
         """Get cart total for a conversation"""
@@ -179,6 +304,30 @@ class StockReservationService:
             "total": total
         }
 
+    async def get_cart_summary(self, conversation_id: str) -> Dict:
+        """Cart totals without the item list (one aggregate query)"""
+        now = datetime.utcnow()
+        async with Database.read_scope() as conn:
+            stmt = lambda_stmt(lambda: select(
+                func.count(StockReservationModel.id).label("item_count"),
+                func.coalesce(func.sum(StockReservationModel.quantity), 0).label("total_quantity"),
+                func.coalesce(func.sum(
+                    ProductModel.price * StockReservationModel.quantity
+                ), 0).label("total"),
+            ).join(
+                ProductModel, ProductModel.id == StockReservationModel.product_id
+            ).where(
+                StockReservationModel.conversation_id == conversation_id,
+                StockReservationModel.expires_at > now
+            ))
+            row = (await conn.execute(stmt)).one()
+
+            return {
+                "item_count": row.item_count,
+                "total_quantity": row.total_quantity,
+                "total": row.total
+            }
+
     async def remove_from_cart(
         self,
         conversation_id: str,
@@ -186,12 +335,11 @@ class StockReservationService:
         quantity: Optional[int] = None
     ) -> Dict:
         """Remove item from cart (release reservation)"""
-        session = await self._get_session()
-        try:
-            stmt = select(StockReservationModel).where(
+        async with Database.session_scope() as session:
+            stmt = lambda_stmt(lambda: select(StockReservationModel).where(
                 StockReservationModel.conversation_id == conversation_id,
                 StockReservationModel.product_id == product_id
-            )
+            ))
             result = await session.execute(stmt)
             reservation = result.scalar_one_or_none()
 
@@ -202,6 +350,7 @@ class StockReservationService:
                 # Remove entire reservation
                 await session.delete(reservation)
                 await session.commit()
+                self._invalidate_available(product_id)
                 return {
                     "success": True,
                     "message": "Producto eliminado del carrito",
@@ -212,24 +361,26 @@ class StockReservationService:
                 new_quantity = reservation.quantity - quantity
                 reservation.quantity = new_quantity
                 await session.commit()
+                self._invalidate_available(product_id)
                 return {
                     "success": True,
                     "message": "Cantidad reducida",
                     "new_quantity": new_quantity,
                     "removed_quantity": quantity
                 }
-        finally:
-            await session.close()
 
     async def confirm_order(self, conversation_id: str, user_id: str) -> Dict:
         """Confirm order: convert reservations to actual stock deduction"""
-        session = await self._get_session()
-        try:
-            # Get all reservations
-            stmt = select(StockReservationModel).where(
+        async with Database.session_scope() as session:
+            now = datetime.utcnow()
+
+            # Get all reservations, batch-loading their products
+            stmt = lambda_stmt(lambda: select(StockReservationModel).options(
+                selectinload(StockReservationModel.product)
+            ).where(
                 StockReservationModel.conversation_id == conversation_id,
-                StockReservationModel.expires_at > datetime.utcnow()
-            )
+                StockReservationModel.expires_at > now
+            ))
             result = await session.execute(stmt)
             reservations = result.scalars().all()
 
@@ -237,41 +388,40 @@ class StockReservationService:
                 return {"success": False, "error": "No hay productos en el carrito"}
 
             order_items = []
+            order_item_rows = []
+            deductions: Dict[str, int] = {}
+            processed_ids = []
             total = 0
-            order_id = str(uuid.uuid4())
-            order_number = f"ORD-{datetime.utcnow().strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
+            # Order id plus one id per item, from one urandom read
+            new_ids = iter(_new_ids(len(reservations) + 1))
+            order_id = next(new_ids)
+            order_number = f"ORD-{now.strftime('%Y%m%d')}-{secrets.token_hex(4).upper()}"
 
-            # Process each reservation
+            # Validate stock and build order items from the loaded products
             for res in reservations:
-                product_stmt = select(ProductModel).where(ProductModel.id == res.product_id)
-                product_result = await session.execute(product_stmt)
-                product = product_result.scalar_one_or_none()
-
+                product = res.product
                 if not product:
                     continue
 
-                # Check and deduct stock
-                new_stock = product.stock - res.quantity
-                if new_stock < 0:
+                if product.stock - deductions.get(res.product_id, 0) - res.quantity < 0:
                     return {
                         "success": False,
                         "error": f"Stock insuficiente para {product.name}"
                     }
 
-                product.stock = new_stock
+                deductions[res.product_id] = deductions.get(res.product_id, 0) + res.quantity
+                processed_ids.append(res.id)
                 item_total = product.price * res.quantity
 
-                # Create order item
-                order_item = OrderItemModel(
-                    id=str(uuid.uuid4()),
-                    order_id=order_id,
-                    product_id=res.product_id,
-                    quantity=res.quantity,
-                    unit_price=product.price,
-                    subtotal=item_total,
-                    discount=0.0
-                )
-                session.add(order_item)
+                order_item_rows.append({
+                    "id": next(new_ids),
+                    "order_id": order_id,
+                    "product_id": res.product_id,
+                    "quantity": res.quantity,
+                    "unit_price": product.price,
+                    "subtotal": item_total,
+                    "discount": 0.0
+                })
 
                 order_items.append({
                     "product_id": res.product_id,
@@ -282,11 +432,32 @@ class StockReservationService:
                 })
                 total += item_total
 
-                # Delete reservation
-                await session.delete(res)
+            if deductions:
+                # Deduct stock for every product in one statement. The bound is
+                # checked inside the UPDATE so concurrent confirms cannot oversell
+                deduction = case(deductions, value=ProductModel.id)
+                deduct_result = await session.execute(
+                    update(ProductModel)
+                    .where(ProductModel.id.in_(deductions), ProductModel.stock >= deduction)
+                    .values(stock=ProductModel.stock - deduction)
+                    .execution_options(synchronize_session=False)
+                )
+                if deduct_result.rowcount != len(deductions):
+                    await session.rollback()
+                    return {
+                        "success": False,
+                        "error": "Stock insuficiente para uno o más productos"
+                    }
 
-            # Create order
-            order = OrderModel(
+                # Release the converted reservations in one statement
+                await session.execute(
+                    delete(StockReservationModel)
+                    .where(StockReservationModel.id.in_(processed_ids))
+                    .execution_options(synchronize_session=False)
+                )
+
+            # Create order and its items as Core INSERTs (items in one executemany)
+            await session.execute(insert(OrderModel).values(
                 id=order_id,
                 order_number=order_number,
                 customer_id=user_id,
@@ -295,10 +466,12 @@ class StockReservationService:
                 tax=0.0,
                 total=total,
                 status="confirmed",
-                created_at=datetime.utcnow()
-            )
-            session.add(order)
+                created_at=now
+            ))
+            if order_item_rows:
+                await session.execute(insert(OrderItemModel), order_item_rows)
             await session.commit()
+            self._invalidate_available(*deductions)
 
             return {
                 "success": True,
@@ -307,49 +480,71 @@ class StockReservationService:
                 "total": total,
                 "message": f"Orden {order_number} confirmada exitosamente"
             }
-        finally:
-            await session.close()
 
     async def release_expired_reservations(self):
-        """Release all expired reservations"""
-        session = await self._get_session()
-        try:
-            stmt = delete(StockReservationModel).where(
-                StockReservationModel.expires_at < datetime.utcnow()
-            )
-            result = await session.execute(stmt)
-            await session.commit()
+        """
+        Release all expired reservations in batches of CLEANUP_BATCH_SIZE,
+        committing and yielding between batches so the SQLite write lock is
+        never held for one long DELETE.
+        """
+        now = datetime.utcnow()
+        released = 0
 
-            if result.rowcount > 0:
-                print(f"Released {result.rowcount} expired reservations")
-        finally:
-            await session.close()
+        while True:
+            async with Database.session_scope() as session:
+                expired_ids = select(StockReservationModel.id).where(
+                    StockReservationModel.expires_at < now
+                ).limit(self.CLEANUP_BATCH_SIZE).scalar_subquery()
+                result = await session.execute(
+                    delete(StockReservationModel)
+                    .where(StockReservationModel.id.in_(expired_ids))
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+
+            released += result.rowcount
+            if result.rowcount < self.CLEANUP_BATCH_SIZE:
+                break
+            await asyncio.sleep(0)
+
+        if released > 0:
+            self._invalidate_available()
+            logger.debug("Released %d expired reservations", released)
 
     async def get_available_stock(self, product_id: str) -> int:
         """Get available stock for a product (total - reserved)"""
-        session = await self._get_session()
-        try:
+        cached = self._available_cache.get(product_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        now = datetime.utcnow()
+        async with Database.read_scope() as conn:
             # Get product stock
-            product_stmt = select(ProductModel).where(ProductModel.id == product_id)
-            result = await session.execute(product_stmt)
-            product = result.scalar_one_or_none()
+            product_stmt = lambda_stmt(
+                lambda: select(ProductModel.stock).where(ProductModel.id == product_id)
+            )
+            result = await conn.execute(product_stmt)
+            stock_row = result.one_or_none()
 
-            if not product:
+            if stock_row is None:
                 return 0
 
-            total_stock = product.stock or 0
+            total_stock = stock_row.stock or 0
 
             # Get total reserved
-            reserved_stmt = select(func.sum(StockReservationModel.quantity)).where(
+            reserved_stmt = lambda_stmt(lambda: select(func.sum(StockReservationModel.quantity)).where(
                 StockReservationModel.product_id == product_id,
-                StockReservationModel.expires_at > datetime.utcnow()
-            )
-            reserved_result = await session.execute(reserved_stmt)
+                StockReservationModel.expires_at > now
+            ))
+            reserved_result = await conn.execute(reserved_stmt)
             total_reserved = reserved_result.scalar() or 0
 
-            return max(0, total_stock - total_reserved)
-        finally:
-            await session.close()
+            available = max(0, total_stock - total_reserved)
+            self._available_cache[product_id] = (
+                available,
+                time.monotonic() + self.AVAILABLE_STOCK_CACHE_TTL_SECONDS
+            )
+            return available
 
 
 # Global instance
@@ -6,11 +6,22 @@ Allows existing code to work without changes while using in-memory storage
 
 from typing import Any, Dict, Optional
 from ..cache.memory_store import get_store, MemoryStore
+import functools
 import json
 import logging
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:  # stdlib fallback
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
+# Key prefixes (plain concatenation is cheaper than f-string formatting)
+_MEMORY_PREFIX = "memory:"
+_MAPPING_PREFIX = "product_mapping:"
+
 
 class RedisShim:
     """
@@ -32,15 +43,15 @@ class RedisShim:
         Get memory state for a conversation
         Used by memory_optimizer.py for fast memory retrieval
         """
-        key = f"memory:{conversation_id}"
+        key = _MEMORY_PREFIX + conversation_id
         data = self._store.get(key)
         if data is None:
             return None
         # If stored as JSON string, parse it
         if isinstance(data, str):
             try:
-                return json.loads(data)
-            except json.JSONDecodeError:
+                return _json_loads(data)
+            except ValueError:
                 return None
         return data
 
@@ -49,7 +60,7 @@ class RedisShim:
         Save memory state for a conversation
         Used by memory_optimizer.py to persist conversation state
         """
-        key = f"memory:{conversation_id}"
+        key = _MEMORY_PREFIX + conversation_id
         # Store as dict directly (MemoryStore handles any type)
         return self._store.set(key, memory_state, ttl=self._memory_ttl)
 
@@ -62,14 +73,14 @@ class RedisShim:
         Get product mapping for a conversation
         Used by sales_agent_v3.py to resolve product references (A1, B2, etc.)
         """
-        key = f"product_mapping:{conversation_id}"
+        key = _MAPPING_PREFIX + conversation_id
         data = self._store.get(key)
         if data is None:
             return None
         if isinstance(data, str):
             try:
-                return json.loads(data)
-            except json.JSONDecodeError:
+                return _json_loads(data)
+            except ValueError:
                 return None
         return data
 
@@ -78,7 +89,7 @@ class RedisShim:
         Save product mapping for a conversation
         Used by sales_agent_v3.py to persist product display mappings
         """
-        key = f"product_mapping:{conversation_id}"
+        key = _MAPPING_PREFIX + conversation_id
         return self._store.set(key, mapping, ttl=self._mapping_ttl)
 
     # ============================================================================
@@ -146,20 +157,15 @@ class RedisShim:
         return self._store.ltrim(key, start, end)
 
 
-# Global instance
-_redis_shim: Optional[RedisShim] = None
-
-
+# Global instance (created once on first call)
+@functools.cache
 def get_redis() -> RedisShim:
     """
     Get Redis-compatible client instance
     This is the main entry point used by other modules
     """
-    global _redis_shim
-    if _redis_shim is None:
-        _redis_shim = RedisShim()
-        logger.info("Initialized Redis shim (using local MemoryStore)")
-    return _redis_shim
+    logger.info("Initialized Redis shim (using local MemoryStore)")
+    return RedisShim()
 
 
 # For compatibility with code that might check Redis availability
@@ -3,16 +3,127 @@ ChromaDB Vector Store Wrapper
 Replaces Pinecone with local embedding storage for semantic search
 """
 
+import asyncio
+import threading
+from collections import OrderedDict
 import chromadb
 from chromadb.config import Settings as ChromaSettings
-from typing import List, Dict, Any, Optional
+from chromadb.utils import embedding_functions
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
-import httpx
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class _EmbeddingCache:
+    """
+    Thread-safe LRU of query text -> embedding in front of an embedding
+    function, so repeated searches skip the model entirely
+    """
+
+    def __init__(self, embedding_function, maxsize: int = 4096):
+        self._embed = embedding_function
+        self._maxsize = maxsize
+        self._vectors: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, texts: List[str]) -> List[Any]:
+        with self._lock:
+            vectors = [self._vectors.get(text) for text in texts]
+            for text, vector in zip(texts, vectors):
+                if vector is not None:
+                    self._vectors.move_to_end(text)
+
+        missing = list(dict.fromkeys(
+            text for text, vector in zip(texts, vectors) if vector is None
+        ))
+        if not missing:
+            return vectors
+
+        # Embed all misses in one model call, outside the lock
+        fresh = dict(zip(missing, self._embed(missing)))
+        with self._lock:
+            for text, vector in fresh.items():
+                self._vectors[text] = vector
+                self._vectors.move_to_end(text)
+            while len(self._vectors) > self._maxsize:
+                self._vectors.popitem(last=False)
+
+        return [
+            vector if vector is not None else fresh[text]
+            for text, vector in zip(texts, vectors)
+        ]
+
+
+class _QueryBatcher:
+    """
+    Coalesces concurrent similarity queries on one collection into a single
+    query(query_embeddings=[...]) call, embedding the batch in one pass.
+    A lone query is sent immediately; queries that arrive while a batch is
+    in flight are picked up together by the next one.
+    """
+
+    MAX_BATCH_SIZE = 32
+
+    def __init__(self, collection, embed: _EmbeddingCache):
+        self._collection = collection
+        self._embed = embed
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def query(self, query: str, top_k: int) -> Dict[str, list]:
+        """Queue a query and wait for its slice of the batched result"""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((query, top_k, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.MAX_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # Callers that gave up while queued do not need a result
+            batch = [item for item in batch if not item[2].done()]
+            if batch:
+                await self._dispatch(batch)
+
+    async def _dispatch(self, batch: List[Tuple[str, int, asyncio.Future]]):
+        texts = [query for query, _, _ in batch]
+        n_results = max(top_k for _, top_k, _ in batch)
+
+        def search():
+            return self._collection.query(
+                query_embeddings=self._embed(texts),
+                n_results=n_results,
+            )
+
+        try:
+            # Embedding + HNSW search block, so run them off the event loop
+            results = await asyncio.to_thread(search)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        ids = results.get("ids") or []
+        distances = results.get("distances") or []
+        metadatas = results.get("metadatas") or []
+        for idx, (_, top_k, future) in enumerate(batch):
+            if future.done():
+                continue
+            future.set_result({
+                "ids": ids[idx][:top_k] if idx < len(ids) else [],
+                "distances": distances[idx][:top_k] if idx < len(distances) else [],
+                "metadatas": metadatas[idx][:top_k] if idx < len(metadatas) else [],
+            })
+
+
 class ChromaStore:
     """
     Wrapper for ChromaDB vector store
@@ -22,11 +133,43 @@ class ChromaStore:
     _client: Optional[chromadb.Client] = None
     _products_collection = None
     _places_collection = None
+    # Bumped whenever the products index changes, so callers caching search
+    # results can tell theirs predate the change
+    products_version: int = 0
+    _products_batcher: Optional[_QueryBatcher] = None
+    _places_batcher: Optional[_QueryBatcher] = None
+    _embedding_function = None
+    _query_embeddings: Optional[_EmbeddingCache] = None
+    QUERY_EMBEDDING_CACHE_SIZE = 4096
+    _initialized: bool = False
+
+    # Index tuning for new collections: M=16 keeps the graph small for a
+    # catalog-sized index, construction_ef/search_ef trade a little build
+    # time for recall at top_k <= 10
+    HNSW_METADATA = {
+        "hnsw:space": "cosine",  # cosine similarity
+        "hnsw:M": 16,
+        "hnsw:construction_ef": 200,
+        "hnsw:search_ef": 64,
+        "hnsw:num_threads": 4,
+    }
+    _init_lock = asyncio.Lock()
     _persist_dir: str = "./data/chroma_db"
 
     @classmethod
     async def initialize(cls, persist_dir: str = "./data/chroma_db"):
-        """Initialize ChromaDB with persistent storage"""
+        """Initialize ChromaDB with persistent storage (idempotent)"""
+        if cls._initialized:
+            return
+
+        async with cls._init_lock:
+            if cls._initialized:
+                return
+            await cls._initialize(persist_dir)
+            cls._initialized = True
+
+    @classmethod
+    async def _initialize(cls, persist_dir: str):
         cls._persist_dir = persist_dir
 
         try:
@@ -43,16 +186,20 @@ class ChromaStore:
                 )
             )
 
+            # One embedder (ONNX MiniLM) shared by both collections, instead
+            # of each collection loading its own copy of the model
+            if cls._embedding_function is None:
+                cls._embedding_function = embedding_functions.DefaultEmbeddingFunction()
+                cls._query_embeddings = _EmbeddingCache(
+                    cls._embedding_function, maxsize=cls.QUERY_EMBEDDING_CACHE_SIZE
+                )
+
             # Get or create collections
-            cls._products_collection = cls._client.get_or_create_collection(
-                name="products",
-                metadata={"hnsw:space": "cosine"},  # cosine similarity
-            )
+            cls._products_collection = cls._get_or_create_collection("products")
+            cls._places_collection = cls._get_or_create_collection("places")
 
-            cls._places_collection = cls._client.get_or_create_collection(
-                name="places",
-                metadata={"hnsw:space": "cosine"},
-            )
+            cls._products_batcher = _QueryBatcher(cls._products_collection, cls._query_embeddings)
+            cls._places_batcher = _QueryBatcher(cls._places_collection, cls._query_embeddings)
 
             logger.info(f"✅ ChromaDB initialized at {persist_dir}")
 
@@ -60,6 +207,25 @@ class ChromaStore:
             logger.error(f"❌ ChromaDB initialization failed: {e}")
             raise
 
+    @classmethod
+    def _get_or_create_collection(cls, name: str):
+        """
+        Open an existing collection as persisted; only new collections get
+        HNSW_METADATA (HNSW parameters are fixed once the index is built)
+        """
+        try:
+            return cls._client.get_collection(
+                name=name,
+                embedding_function=cls._embedding_function,
+            )
+        except Exception:
+            # Missing collection (ValueError or NotFoundError, by chromadb version)
+            return cls._client.create_collection(
+                name=name,
+                metadata=cls.HNSW_METADATA,
+                embedding_function=cls._embedding_function,
+            )
+
     @classmethod
     async def upsert_product(
         cls,
@@ -88,26 +254,19 @@ class ChromaStore:
             raise RuntimeError("ChromaDB not initialized. Call initialize() first.")
 
         try:
-            # Combine text for embedding
-            combined_text = f"{name} {description} {category}"
-            if sku:
-                combined_text += f" {sku}"
-
-            # Prepare metadata
-            doc_metadata = metadata or {}
-            doc_metadata.update({
-                "name": name,
-                "category": category,
-                "sku": sku or "",
-            })
+            combined_text, doc_metadata = cls._product_document(
+                name, description, category, sku, metadata
+            )
 
             # Upsert to ChromaDB (auto-generates embedding)
-            cls._products_collection.upsert(
+            await asyncio.to_thread(
+                cls._products_collection.upsert,
                 ids=[product_id],
                 documents=[combined_text],
                 metadatas=[doc_metadata],
             )
 
+            cls.products_version += 1
             logger.debug(f"Indexed product {product_id}: {name}")
             return True
 
@@ -115,6 +274,161 @@ class ChromaStore:
             logger.error(f"Error upserting product {product_id}: {e}")
             return False
 
+    UPSERT_BATCH_SIZE = 256
+
+    @classmethod
+    async def upsert_products_bulk(cls, rows: List[Dict[str, Any]]) -> int:
+        """
+        Index many products with one upsert call per UPSERT_BATCH_SIZE rows
+
+        Args:
+            rows: Dicts with id, name, description, category and optional
+                  sku / metadata (same fields as upsert_product)
+
+        Returns:
+            Number of products indexed
+        """
+        if not cls._products_collection:
+            raise RuntimeError("ChromaDB not initialized. Call initialize() first.")
+
+        indexed = 0
+        for start in range(0, len(rows), cls.UPSERT_BATCH_SIZE):
+            batch = rows[start:start + cls.UPSERT_BATCH_SIZE]
+            documents = [
+                cls._product_document(
+                    row["name"], row["description"], row["category"],
+                    row.get("sku"), row.get("metadata")
+                )
+                for row in batch
+            ]
+            try:
+                await asyncio.to_thread(
+                    cls._products_collection.upsert,
+                    ids=[row["id"] for row in batch],
+                    documents=[text for text, _ in documents],
+                    metadatas=[doc_metadata for _, doc_metadata in documents],
+                )
+                indexed += len(batch)
+            except Exception as e:
+                logger.error(f"Error bulk upserting products {start}-{start + len(batch)}: {e}")
+
+        if indexed:
+            cls.products_version += 1
+        logger.debug(f"Bulk indexed {indexed}/{len(rows)} products")
+        return indexed
+
+    # ============================================================================
+    # Background Indexing Queue
+    # ============================================================================
+
+    UPSERT_QUEUE_MAXSIZE = 10_000
+    UPSERT_DRAIN_BATCH_SIZE = 64
+    UPSERT_FLUSH_INTERVAL = 0.05  # seconds to wait for more products after the first
+    _upsert_queue: Optional[asyncio.Queue] = None
+    _upsert_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def enqueue_product_upsert(
+        cls,
+        product_id: str,
+        name: str,
+        description: str,
+        category: str,
+        sku: str = None,
+        metadata: Dict[str, Any] = None,
+    ) -> bool:
+        """
+        Queue a product for indexing and return immediately; a background
+        task embeds and upserts queued products in batches
+
+        Returns:
+            False if the queue is full and the product was not queued
+        """
+        if not cls._products_collection:
+            raise RuntimeError("ChromaDB not initialized. Call initialize() first.")
+
+        if cls._upsert_task is None or cls._upsert_task.done():
+            cls._upsert_queue = asyncio.Queue(maxsize=cls.UPSERT_QUEUE_MAXSIZE)
+            cls._upsert_task = asyncio.create_task(cls._drain_upserts())
+
+        try:
+            cls._upsert_queue.put_nowait({
+                "id": product_id,
+                "name": name,
+                "description": description,
+                "category": category,
+                "sku": sku,
+                "metadata": metadata,
+            })
+        except asyncio.QueueFull:
+            logger.warning(f"Indexing queue full, product {product_id} not queued")
+            return False
+        return True
+
+    @classmethod
+    async def _drain_upserts(cls):
+        """
+        Upsert queued products in one call per batch: a batch closes after
+        UPSERT_FLUSH_INTERVAL or UPSERT_DRAIN_BATCH_SIZE products, whichever
+        comes first, so a burst of writes shares a single embed + upsert
+        """
+        queue = cls._upsert_queue
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = [await queue.get()]
+            deadline = loop.time() + cls.UPSERT_FLUSH_INTERVAL
+            while len(rows) < cls.UPSERT_DRAIN_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                # Only the latest queued version of each product is indexed
+                await cls.upsert_products_bulk(list({row["id"]: row for row in rows}.values()))
+            except Exception as e:
+                logger.warning(f"Error indexing {len(rows)} queued products: {e}")
+            finally:
+                for _ in rows:
+                    queue.task_done()
+
+    @classmethod
+    async def shutdown(cls, timeout: float = 10.0):
+        """Flush queued product upserts and stop the indexing task"""
+        if cls._upsert_task is None:
+            return
+        try:
+            await asyncio.wait_for(cls._upsert_queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{cls._upsert_queue.qsize()} queued product upserts dropped on shutdown")
+        cls._upsert_task.cancel()
+        cls._upsert_task = None
+
+    @staticmethod
+    def _product_document(
+        name: str,
+        description: str,
+        category: str,
+        sku: Optional[str],
+        metadata: Optional[Dict[str, Any]],
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Embedding text and metadata for a product"""
+        # Combine text for embedding
+        combined_text = f"{name} {description} {category}"
+        if sku:
+            combined_text += f" {sku}"
+
+        # Prepare metadata (new dict; the caller's metadata is not mutated)
+        doc_metadata = {
+            **(metadata or {}),
+            "name": name,
+            "category": category,
+            "sku": sku or "",
+        }
+        return combined_text, doc_metadata
+
     @classmethod
     async def search_products(
         cls,
@@ -134,22 +448,23 @@ class ChromaStore:
             List of matching products with scores
             Format: [{"id": str, "distance": float, "metadata": dict}, ...]
         """
+        # Nothing to embed or return: skip the embedding + HNSW query
+        if top_k <= 0 or not query or not query.strip():
+            return []
+
         if not cls._products_collection:
             raise RuntimeError("ChromaDB not initialized. Call initialize() first.")
 
         try:
-            # Query ChromaDB
-            results = cls._products_collection.query(
-                query_texts=[query],
-                n_results=top_k,
-            )
+            # Query ChromaDB (batched with concurrent searches)
+            results = await cls._products_batcher.query(query, top_k)
 
             # Format results
             products = []
-            if results["ids"] and len(results["ids"]) > 0:
-                for idx, product_id in enumerate(results["ids"][0]):
-                    distance = results["distances"][0][idx] if results["distances"] else 0
-                    metadata = results["metadatas"][0][idx] if results["metadatas"] else {}
+            if results["ids"]:
+                for idx, product_id in enumerate(results["ids"]):
+                    distance = results["distances"][idx] if results["distances"] else 0
+                    metadata = results["metadatas"][idx] if results["metadatas"] else {}
 
                     products.append({
                         "id": product_id,
@@ -171,7 +486,8 @@ class ChromaStore:
             raise RuntimeError("ChromaDB not initialized. Call initialize() first.")
 
         try:
-            cls._products_collection.delete(ids=[product_id])
+            await asyncio.to_thread(cls._products_collection.delete, ids=[product_id])
+            cls.products_version += 1
             logger.debug(f"Deleted product {product_id} from vector store")
             return True
         except Exception as e:
@@ -215,16 +531,17 @@ class ChromaStore:
             if address:
                 combined_text += f" {address}"
 
-            # Prepare metadata
-            doc_metadata = metadata or {}
-            doc_metadata.update({
+            # Prepare metadata (new dict; the caller's metadata is not mutated)
+            doc_metadata = {
+                **(metadata or {}),
                 "title": title,
                 "category": category,
                 "address": address or "",
-            })
+            }
 
             # Upsert to ChromaDB
-            cls._places_collection.upsert(
+            await asyncio.to_thread(
+                cls._places_collection.upsert,
                 ids=[place_id],
                 documents=[combined_text],
                 metadatas=[doc_metadata],
@@ -255,22 +572,23 @@ class ChromaStore:
         Returns:
             List of matching places with scores
         """
+        # Nothing to embed or return: skip the embedding + HNSW query
+        if top_k <= 0 or not query or not query.strip():
+            return []
+
         if not cls._places_collection:
             raise RuntimeError("ChromaDB not initialized. Call initialize() first.")
 
         try:
-            # Query ChromaDB
-            results = cls._places_collection.query(
-                query_texts=[query],
-                n_results=top_k,
-            )
+            # Query ChromaDB (batched with concurrent searches)
+            results = await cls._places_batcher.query(query, top_k)
 
             # Format results
             places = []
-            if results["ids"] and len(results["ids"]) > 0:
-                for idx, place_id in enumerate(results["ids"][0]):
-                    distance = results["distances"][0][idx] if results["distances"] else 0
-                    metadata = results["metadatas"][0][idx] if results["metadatas"] else {}
+            if results["ids"]:
+                for idx, place_id in enumerate(results["ids"]):
+                    distance = results["distances"][idx] if results["distances"] else 0
+                    metadata = results["metadatas"][idx] if results["metadatas"] else {}
 
                     places.append({
                         "id": place_id,
@@ -292,7 +610,7 @@ class ChromaStore:
             raise RuntimeError("ChromaDB not initialized. Call initialize() first.")
 
         try:
-            cls._places_collection.delete(ids=[place_id])
+            await asyncio.to_thread(cls._places_collection.delete, ids=[place_id])
             logger.debug(f"Deleted place {place_id} from vector store")
             return True
         except Exception as e:
@@ -306,8 +624,14 @@ class ChromaStore:
             return {"status": "not_initialized"}
 
         try:
-            product_count = cls._products_collection.count() if cls._products_collection else 0
-            places_count = cls._places_collection.count() if cls._places_collection else 0
+            product_count = (
+                await asyncio.to_thread(cls._products_collection.count)
+                if cls._products_collection else 0
+            )
+            places_count = (
+                await asyncio.to_thread(cls._places_collection.count)
+                if cls._places_collection else 0
+            )
 
             return {
                 "status": "initialized",
@@ -325,6 +649,8 @@ class ChromaStore:
         if cls._client:
             try:
                 cls._client.reset()
+                cls._initialized = False
+                cls.products_version += 1
                 logger.info("ChromaDB reset")
             except Exception as e:
                 logger.error(f"Error resetting ChromaDB: {e}")
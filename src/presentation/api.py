@@ -3,7 +3,9 @@ FastAPI application setup and configuration
 Sales Agent with LangGraph - Supervisor Architecture
 """
 from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from contextlib import asynccontextmanager
 from ..config import settings
@@ -26,6 +28,7 @@ class ProxyHeadersMiddleware(BaseHTTPMiddleware):
 
 from ..infrastructure.database.sqlite_db import Database
 from ..infrastructure.vectorstore.chroma_store import ChromaStore
+from ..infrastructure.openai.audio_client import close_session as close_audio_session
 from .routes import products, health, download, receipt, agent, audio, tts
 
 
@@ -68,11 +71,23 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     print("[SHUTDOWN] Shutting down Sales Agent API...")
+    try:
+        await agent.flush_followups()
+    except Exception as e:
+        print(f"[WARN] Follow-up flush error: {e}")
+    try:
+        await ChromaStore.shutdown()
+    except Exception as e:
+        print(f"[WARN] ChromaDB shutdown error: {e}")
     try:
         await Database.disconnect()
         print("[OK] SQLite disconnected")
     except Exception as e:
         print(f"[WARN] SQLite disconnect error: {e}")
+    try:
+        await close_audio_session()
+    except Exception as e:
+        print(f"[WARN] Audio client close error: {e}")
     print("[OK] All services stopped gracefully")
 
 
@@ -84,6 +99,8 @@ def create_app() -> FastAPI:
         description="Agente de ventas digital con IA",
         version="1.0.0",
         lifespan=lifespan,
+        # Serialize responses with orjson (C, native datetime support)
+        default_response_class=ORJSONResponse,
     )
     
     # Root endpoints (defined first)
@@ -127,6 +144,24 @@ def create_app() -> FastAPI:
         max_age=3600,
     )
     
+    # Compress receipt HTML and JSON lists for clients that accept gzip.
+    # Already-compressed bodies are skipped: gzip would only add CPU, buffer
+    # streamed TTS audio and drop Content-Length/range support on PDFs
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=1024,
+        compresslevel=5,
+        exclude_content_types=(
+            "text/event-stream",
+            "audio/*",
+            "application/pdf",
+            "image/*",
+            "video/*",
+            "application/zip",
+            "application/gzip",
+        ),
+    )
+    
     return app
 
 # Create the app instance
@@ -1,29 +1,34 @@
 """
 Agent endpoints - LangGraph Sales Agent with Supervisor
 """
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict, Set
 from datetime import datetime
+import asyncio
+import base64
 import json
+import logging
 
 from ...infrastructure.langgraph.graph import get_sales_graph
 from ...infrastructure.database.mongodb import MongoDB
 from ...infrastructure.services.stock_reservation import get_stock_service
 from ...infrastructure.langgraph.nodes.followup_monitor import get_followup_monitor
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
 # Request/Response models
 class StartConversationRequest(BaseModel):
-    user_id: Optional[str] = "guest"
+    user_id: str = "guest"
 
 
 class SendMessageRequest(BaseModel):
     conversation_id: str
     message: str
-    user_id: Optional[str] = "guest"
+    user_id: str = "guest"
 
 
 class HumanResponseRequest(BaseModel):
@@ -34,6 +39,8 @@ class HumanResponseRequest(BaseModel):
 
 
 class ConversationResponse(BaseModel):
+    # Built from our own graph/db output, so handlers use model_construct
+    # (no validation); FastAPI still checks it against response_model
     conversation_id: str
     message: str
     status: str
@@ -53,18 +60,74 @@ async def start_conversation(request: StartConversationRequest):
         graph = get_sales_graph()
         result = await graph.start_conversation(user_id=request.user_id)
         
-        return ConversationResponse(
+        return ConversationResponse.model_construct(
             conversation_id=result["conversation_id"],
             message=result["message"],
             status="started",
             reasoning_trace=result.get("reasoning_trace", [])
         )
     except Exception as e:
-        import traceback
-        print(f"Error starting conversation: {traceback.format_exc()}")
+        logger.exception("Error starting conversation")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _paused_response(db, conversation_id: str) -> Optional[ConversationResponse]:
+    """Reply for a conversation paused by an escalation, or None if it is active"""
+    conversation = await db.conversations.find_one(
+        {"conversation_id": conversation_id},
+        projection={"_id": 0, "status": 1, "escalation_id": 1}
+    )
+    if conversation and conversation.get("status") == "escalated":
+        escalation_id = conversation.get("escalation_id")
+        return ConversationResponse.model_construct(
+            conversation_id=conversation_id,
+            message="Tu consulta está siendo atendida por un supervisor. Por favor espera mientras te asistimos.",
+            status="paused",
+            requires_human=True,
+            escalation={"id": escalation_id, "status": "pending"},
+            reasoning_trace=[],
+            cart=[]
+        )
+    return None
+
+
+async def _agent_response(db, result: dict) -> ConversationResponse:
+    """Build the reply for a finished graph run"""
+    conversation_id = result["conversation_id"]
+    
+    # Reset follow-up timer AFTER assistant responds (not when user sends message)
+    monitor = get_followup_monitor()
+    await monitor.reset_timer(conversation_id)
+    
+    # Check for applied coupon
+    # Read after the graph run: the agent may have applied a coupon this turn
+    coupon_data = await db.cart_coupons.find_one(
+        {"conversation_id": conversation_id},
+        projection={"_id": 0}
+    )
+    coupon = None
+    if coupon_data:
+        coupon = {
+            "coupon_code": coupon_data.get("coupon_code"),
+            "discount_percent": coupon_data.get("discount_percent"),
+            "discount_amount": coupon_data.get("discount"),
+            "original_total": coupon_data.get("original_total"),
+            "new_total": coupon_data.get("new_total")
+        }
+    
+    return ConversationResponse.model_construct(
+        conversation_id=conversation_id,
+        message=result["message"],
+        status=result.get("status", "completed"),
+        requires_human=result.get("requires_human", False),
+        escalation=result.get("escalation"),
+        reasoning_trace=result.get("reasoning_trace", []),
+        cart=result.get("cart", []),
+        coupon=coupon,
+        conversation_stage=result.get("conversation_stage", "discovery")
+    )
+
+
 @router.post("/message", response_model=ConversationResponse)
 async def send_message(request: SendMessageRequest):
     """Send a message to the Sales Agent"""
@@ -72,18 +135,9 @@ async def send_message(request: SendMessageRequest):
         db = MongoDB.get_database()
         
         # Check if conversation is paused due to escalation
-        conversation = await db.conversations.find_one({"conversation_id": request.conversation_id})
-        if conversation and conversation.get("status") == "escalated":
-            escalation_id = conversation.get("escalation_id")
-            return ConversationResponse(
-                conversation_id=request.conversation_id,
-                message="Tu consulta está siendo atendida por un supervisor. Por favor espera mientras te asistimos.",
-                status="paused",
-                requires_human=True,
-                escalation={"id": escalation_id, "status": "pending"},
-                reasoning_trace=[],
-                cart=[]
-            )
+        paused = await _paused_response(db, request.conversation_id)
+        if paused:
+            return paused
         
         graph = get_sales_graph()
         result = await graph.process_message(
@@ -91,72 +145,65 @@ async def send_message(request: SendMessageRequest):
             message=request.message,
             user_id=request.user_id
         )
-        
-        # Reset follow-up timer AFTER assistant responds (not when user sends message)
-        monitor = get_followup_monitor()
-        await monitor.reset_timer(request.conversation_id)
-        
-        # Check for applied coupon
-        coupon_data = await db.cart_coupons.find_one({"conversation_id": request.conversation_id})
-        coupon = None
-        if coupon_data:
-            coupon = {
-                "coupon_code": coupon_data.get("coupon_code"),
-                "discount_percent": coupon_data.get("discount_percent"),
-                "discount_amount": coupon_data.get("discount"),
-                "original_total": coupon_data.get("original_total"),
-                "new_total": coupon_data.get("new_total")
-            }
-        
-        return ConversationResponse(
-            conversation_id=result["conversation_id"],
-            message=result["message"],
-            status=result.get("status", "completed"),
-            requires_human=result.get("requires_human", False),
-            escalation=result.get("escalation"),
-            reasoning_trace=result.get("reasoning_trace", []),
-            cart=result.get("cart", []),
-            coupon=coupon,
-            conversation_stage=result.get("conversation_stage", "discovery")
-        )
+        return await _agent_response(db, result)
     except Exception as e:
-        import traceback
-        print(f"Error processing message: {traceback.format_exc()}")
+        logger.exception("Error processing message")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.websocket("/ws/message")
+async def websocket_message(websocket: WebSocket):
+    """
+    Streaming variant of POST /message.
+
+    Send {"conversation_id", "message", "user_id"} frames; the agent's reply
+    arrives as {"type": "token", "content"} frames followed by one
+    {"type": "done", ...ConversationResponse} frame.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            try:
+                request = SendMessageRequest(**data)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            
+            try:
+                db = MongoDB.get_database()
+                paused = await _paused_response(db, request.conversation_id)
+                if paused:
+                    await websocket.send_json({"type": "done", **paused.model_dump()})
+                    continue
+                
+                graph = get_sales_graph()
+                async for event in graph.stream_message(
+                    conversation_id=request.conversation_id,
+                    message=request.message,
+                    user_id=request.user_id
+                ):
+                    if event["type"] == "token":
+                        await websocket.send_json(event)
+                    else:
+                        response = await _agent_response(db, event)
+                        await websocket.send_json({"type": "done", **response.model_dump()})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                logger.exception("Error streaming message")
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+
+
 @router.post("/human/respond", response_model=ConversationResponse)
-async def human_respond(request: HumanResponseRequest):
+async def human_respond(request: HumanResponseRequest, background_tasks: BackgroundTasks):
     """Handle human supervisor response to an escalation"""
     try:
         db = MongoDB.get_database()
         
-        # Update escalation status
-        await db.escalations.update_one(
-            {"id": request.escalation_id},
-            {
-                "$set": {
-                    "status": request.action,
-                    "supervisor_response": request.supervisor_response,
-                    "resolved_at": datetime.utcnow()
-                }
-            }
-        )
-        
-        # Resume conversation (remove paused status)
-        await db.conversations.update_one(
-            {"conversation_id": request.conversation_id},
-            {
-                "$set": {
-                    "status": "active",
-                    "resumed_at": datetime.utcnow()
-                },
-                "$unset": {
-                    "escalation_id": "",
-                    "paused_at": ""
-                }
-            }
-        )
+        now = datetime.utcnow()
         
         # Determine response message based on action
         if request.action == "approve":
@@ -166,17 +213,53 @@ async def human_respond(request: HumanResponseRequest):
         else:  # reject
             message = "Lo sentimos, no podemos procesar esta solicitud. Si tienes alguna otra consulta sobre nuestros productos, estaré encantado de ayudarte."
         
-        # Store supervisor message in conversation
-        await db.conversation_messages.insert_one({
+        # Both updates are independent: resolve the escalation and resume the
+        # conversation (remove paused status)
+        await asyncio.gather(
+            db.escalations.update_one(
+                {"id": request.escalation_id},
+                {
+                    "$set": {
+                        "status": request.action,
+                        "supervisor_response": request.supervisor_response,
+                        "resolved_at": now
+                    }
+                }
+            ),
+            db.conversations.update_one(
+                {"conversation_id": request.conversation_id},
+                {
+                    "$set": {
+                        "status": "active",
+                        "resumed_at": now
+                    },
+                    "$unset": {
+                        "escalation_id": "",
+                        "paused_at": ""
+                    }
+                }
+            )
+        )
+        
+        # Storing the supervisor message and pushing it to the customer's
+        # socket aren't needed for the response; run them after it is sent
+        background_tasks.add_task(db.conversation_messages.insert_one, {
             "conversation_id": request.conversation_id,
             "role": "supervisor",
             "content": message,
             "action": request.action,
             "escalation_id": request.escalation_id,
-            "timestamp": datetime.utcnow()
+            "timestamp": now
+        })
+        background_tasks.add_task(manager.send_to_conversation, request.conversation_id, {
+            "type": "supervisor",
+            "conversation_id": request.conversation_id,
+            "message": message,
+            "action": request.action,
+            "timestamp": now.isoformat()
         })
         
-        return ConversationResponse(
+        return ConversationResponse.model_construct(
             conversation_id=request.conversation_id,
             message=message,
             status=request.action,
@@ -184,15 +267,14 @@ async def human_respond(request: HumanResponseRequest):
                 "agent": "Supervisor",
                 "action": request.action,
                 "reasoning": f"Supervisor respondió con acción: {request.action}",
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": now.isoformat(),
                 "result": {"action": request.action}
             }]
         )
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error handling human response: {traceback.format_exc()}")
+        logger.exception("Error handling human response")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -216,12 +298,9 @@ async def get_pending_escalations():
     """Get all pending escalations for supervisor dashboard"""
     try:
         db = MongoDB.get_database()
-        cursor = db.escalations.find({"status": "pending"}).sort("timestamp", -1).limit(50)
-        
-        escalations = []
-        async for doc in cursor:
-            doc.pop("_id", None)
-            escalations.append(doc)
+        escalations = await db.escalations.find(
+            {"status": "pending"}, projection={"_id": 0}
+        ).sort("timestamp", -1).to_list(length=50)
         
         return {
             "escalations": escalations,
@@ -236,12 +315,9 @@ async def get_all_escalations():
     """Get all escalations (for history)"""
     try:
         db = MongoDB.get_database()
-        cursor = db.escalations.find({}).sort("timestamp", -1).limit(100)
-        
-        escalations = []
-        async for doc in cursor:
-            doc.pop("_id", None)
-            escalations.append(doc)
+        escalations = await db.escalations.find(
+            {}, projection={"_id": 0}
+        ).sort("timestamp", -1).to_list(length=100)
         
         return {
             "escalations": escalations,
@@ -272,21 +348,48 @@ async def get_escalation(escalation_id: str):
 # WebSocket for real-time escalation notifications
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
+        # Customer sockets, keyed by conversation for follow-up push
+        self.by_conversation: Dict[str, Set[WebSocket]] = {}
     
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, conversation_id: Optional[str] = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        if conversation_id is None:
+            self.active_connections.add(websocket)
+        else:
+            self.by_conversation.setdefault(conversation_id, set()).add(websocket)
+    
+    def disconnect(self, websocket: WebSocket, conversation_id: Optional[str] = None):
+        if conversation_id is None:
+            self.active_connections.discard(websocket)
+            return
+        sockets = self.by_conversation.get(conversation_id)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del self.by_conversation[conversation_id]
     
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+    @staticmethod
+    async def _fanout(connections: List[WebSocket], message: dict) -> List[WebSocket]:
+        """Send one pre-encoded payload to all sockets concurrently, return the dead ones"""
+        if not connections:
+            return []
+        payload = json.dumps(message)
+        results = await asyncio.gather(
+            *(connection.send_text(payload) for connection in connections),
+            return_exceptions=True
+        )
+        return [c for c, r in zip(connections, results) if isinstance(r, Exception)]
     
     async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+        dead = await self._fanout(list(self.active_connections), message)
+        self.active_connections.difference_update(dead)
+    
+    async def send_to_conversation(self, conversation_id: str, message: dict):
+        """Push a message only to the sockets watching this conversation"""
+        dead = await self._fanout(list(self.by_conversation.get(conversation_id, ())), message)
+        for connection in dead:
+            self.disconnect(connection, conversation_id)
 
 
 manager = ConnectionManager()
@@ -308,6 +411,43 @@ async def websocket_escalations(websocket: WebSocket):
         manager.disconnect(websocket)
 
 
+@router.websocket("/ws/conversation/{conversation_id}")
+async def websocket_conversation(websocket: WebSocket, conversation_id: str, since: Optional[str] = None):
+    """WebSocket for follow-up messages of a single conversation.
+
+    Pass ``since`` (ISO timestamp) on reconnect to replay follow-ups stored
+    while the socket was down.
+    """
+    await manager.connect(websocket, conversation_id)
+    try:
+        if since:
+            try:
+                since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
+            except ValueError:
+                since_dt = None
+            if since_dt is not None:
+                db = MongoDB.get_database()
+                # Served by ix_conversation_messages_conv_type_ts
+                missed = await db.conversation_messages.find(
+                    {"conversation_id": conversation_id, "type": "followup", "timestamp": {"$gt": since_dt}},
+                    projection={"_id": 0, "content": 1, "timestamp": 1}
+                ).sort("timestamp", 1).to_list(length=500)
+                for doc in missed:
+                    await websocket.send_json({
+                        "type": "followup",
+                        "conversation_id": conversation_id,
+                        "message": doc["content"],
+                        "timestamp": doc["timestamp"]
+                    })
+        
+        while True:
+            data = await websocket.receive_text()
+            if data == "ping":
+                await websocket.send_json({"type": "pong"})
+    except WebSocketDisconnect:
+        manager.disconnect(websocket, conversation_id)
+
+
 async def notify_new_escalation(escalation: dict):
     """Notify all connected supervisors of a new escalation"""
     await manager.broadcast({
@@ -335,7 +475,7 @@ async def get_cart(conversation_id: str):
 
 class ConfirmOrderRequest(BaseModel):
     conversation_id: str
-    user_id: Optional[str] = "guest"
+    user_id: str = "guest"
 
 
 @router.post("/cart/confirm")
@@ -360,32 +500,60 @@ async def confirm_order(request: ConfirmOrderRequest):
 
 # Orders endpoints
 @router.get("/orders")
-async def get_orders(page: int = 1, page_size: int = 10):
-    """Get all orders with pagination"""
+async def get_orders(page: int = 1, page_size: int = 10, cursor: Optional[str] = None):
+    """
+    Get all orders, newest first.
+
+    Pass the previous response's ``next_cursor`` as ``cursor`` to get the
+    next page; each page then costs O(page_size) on the created_at index.
+    The cursor carries (created_at, id), so orders sharing a timestamp are
+    not skipped. ``page`` (offset pagination) is deprecated and ignored when
+    ``cursor`` is given; the response then reports ``page`` as null.
+    """
     try:
         db = MongoDB.get_database()
         
-        # Get total count
-        total_count = await db.orders.count_documents({})
+        if cursor:
+            try:
+                created_at, _, last_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+                cursor_dt = datetime.fromisoformat(created_at)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = {"$or": [
+                {"created_at": {"$lt": cursor_dt}},
+                {"created_at": cursor_dt, "_id": {"$lt": last_id}},
+            ]}
+            skip = 0
+        else:
+            query = {}
+            skip = (page - 1) * page_size
+        
+        # Get total count and the requested page concurrently
+        total_count, orders = await asyncio.gather(
+            db.orders.estimated_document_count(),
+            db.orders.find(
+                query, projection={"_id": 0}
+            ).sort([("created_at", -1), ("_id", -1)]).skip(skip).to_list(length=page_size)
+        )
         total_pages = (total_count + page_size - 1) // page_size if total_count > 0 else 1
-        
-        # Get paginated orders
-        skip = (page - 1) * page_size
-        cursor = db.orders.find({}).sort("created_at", -1).skip(skip).limit(page_size)
-        
-        orders = []
-        async for doc in cursor:
-            doc.pop("_id", None)
-            orders.append(doc)
+        next_cursor = None
+        if len(orders) == page_size:
+            last = orders[-1]
+            next_cursor = base64.urlsafe_b64encode(
+                f"{last['created_at']}|{last['id']}".encode()
+            ).decode()
         
         return {
             "orders": orders,
             "count": len(orders),
             "total": total_count,
-            "page": page,
+            "page": None if cursor else page,
             "page_size": page_size,
-            "total_pages": total_pages
+            "total_pages": total_pages,
+            "next_cursor": next_cursor
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -408,6 +576,46 @@ async def get_order(order_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Follow-up messages are buffered briefly and written with one insert_many
+FOLLOWUP_FLUSH_DELAY = 0.05  # seconds
+_followup_buffer: List[dict] = []
+_followup_stored: Optional[asyncio.Future] = None  # resolves once the pending batch is written
+_followup_writes: Set[asyncio.Task] = set()
+
+
+async def _flush_followups():
+    """Wait for the rest of the burst, then store the buffered follow-ups"""
+    global _followup_buffer, _followup_stored
+    await asyncio.sleep(FOLLOWUP_FLUSH_DELAY)
+    batch, _followup_buffer = _followup_buffer, []
+    stored, _followup_stored = _followup_stored, None
+    try:
+        await MongoDB.get_database().conversation_messages.insert_many(batch, ordered=False)
+    except Exception as e:
+        logger.warning("Error storing %d follow-up messages: %s", len(batch), e)
+    finally:
+        if not stored.done():
+            stored.set_result(None)
+
+
+def _buffer_followup(doc: dict) -> asyncio.Future:
+    """Queue a follow-up for the next batch; the future resolves once it is stored"""
+    global _followup_stored
+    _followup_buffer.append(doc)
+    if _followup_stored is None:
+        _followup_stored = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(_flush_followups())
+        _followup_writes.add(task)
+        task.add_done_callback(_followup_writes.discard)
+    return _followup_stored
+
+
+async def flush_followups():
+    """Wait until buffered follow-ups are stored (called on shutdown)"""
+    if _followup_writes:
+        await asyncio.gather(*_followup_writes, return_exceptions=True)
+
+
 # Follow-up endpoints
 @router.post("/followup/start/{conversation_id}")
 async def start_followup_monitoring(conversation_id: str):
@@ -417,9 +625,8 @@ async def start_followup_monitoring(conversation_id: str):
         
         async def followup_callback(conv_id: str, message: str):
             # Store follow-up message in conversation
-            db = MongoDB.get_database()
             timestamp = datetime.utcnow()
-            await db.conversation_messages.insert_one({
+            stored = _buffer_followup({
                 "conversation_id": conv_id,
                 "role": "assistant",
                 "content": message,
@@ -439,10 +646,12 @@ async def start_followup_monitoring(conversation_id: str):
                 }
                 await graph.app.aupdate_state(config, {"messages": [followup_message]})
             except Exception as e:
-                print(f"[FOLLOWUP] Error adding to graph state: {e}")
+                logger.warning("Error adding follow-up to graph state: %s", e)
             
-            # Broadcast to WebSocket
-            await manager.broadcast({
+            # Push only once stored, so a ?since= replay can never miss a
+            # follow-up the socket already delivered
+            await asyncio.shield(stored)
+            await manager.send_to_conversation(conv_id, {
                 "type": "followup",
                 "conversation_id": conv_id,
                 "message": message,
@@ -503,39 +712,3 @@ async def get_followup_status(conversation_id: str):
         return status
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-
-@router.get("/followup/messages/{conversation_id}")
-async def get_followup_messages(conversation_id: str, since: str = None):
-    """Get pending follow-up messages for a conversation (for polling)"""
-    try:
-        db = MongoDB.get_database()
-        
-        query = {
-            "conversation_id": conversation_id,
-            "type": "followup"
-        }
-        
-        if since:
-            from datetime import datetime
-            try:
-                since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
-                query["timestamp"] = {"$gt": since_dt}
-            except:
-                pass
-        
-        cursor = db.conversation_messages.find(query).sort("timestamp", 1)
-        messages = []
-        async for doc in cursor:
-            doc.pop("_id", None)
-            if hasattr(doc.get("timestamp"), "isoformat"):
-                doc["timestamp"] = doc["timestamp"].isoformat()
-            messages.append(doc)
-        
-        return {
-            "conversation_id": conversation_id,
-            "messages": messages,
-            "count": len(messages)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
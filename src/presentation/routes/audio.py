@@ -30,10 +30,12 @@ async def transcribe_audio(
     try:
         audio_client = AudioClient()
         
-        audio_bytes = await file.read()
+        # UploadFile is already spooled to a temp file; stream it to Whisper
+        # instead of materializing the whole upload as bytes
+        await file.seek(0)
         
         result = await audio_client.transcribe(
-            audio_file=audio_bytes,
+            audio_file=file.file,
             filename=file.filename or "audio.webm",
             language=language
         )
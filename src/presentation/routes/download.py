@@ -3,10 +3,14 @@ Download endpoints for PDFs and files
 """
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import FileResponse
+import asyncio
 import os
 
 router = APIRouter()
 
+# Same directory the PDF generator writes to, resolved once at import
+PDF_DIR = os.path.join(os.getcwd(), 'pdfs')
+
 
 @router.get("/pdf/{filename}")
 async def download_pdf(filename: str):
@@ -18,14 +22,18 @@ async def download_pdf(filename: str):
     # Sanitize filename to prevent path traversal
     filename = os.path.basename(filename)
     
-    pdf_dir = os.path.join(os.getcwd(), 'pdfs')
-    file_path = os.path.join(pdf_dir, filename)
+    file_path = os.path.join(PDF_DIR, filename)
     
-    if not os.path.exists(file_path):
+    # Stat off the event loop; FileResponse reuses the result instead of re-statting
+    try:
+        stat_result = await asyncio.to_thread(os.stat, file_path)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
     
     return FileResponse(
         path=file_path,
         filename=filename,
-        media_type='application/pdf'
+        media_type='application/pdf',
+        stat_result=stat_result,
+        headers={"Cache-Control": "public, max-age=3600"}
     )
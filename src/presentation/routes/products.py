@@ -1,10 +1,17 @@
 """
 Products endpoints
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
+import base64
+import binascii
+import hashlib
+import json
+import time
 import uuid
 
 from ...infrastructure.repositories.product_repository import SQLAlchemyProductRepository
@@ -14,6 +21,42 @@ from ...domain.entities import Product
 
 router = APIRouter()
 
+# Formatted /recommend results keyed by (product_id, limit), least recently
+# used evicted first. Entries expire after RECOMMENDATION_TTL seconds, are
+# dropped on any product write, and are ignored once the Chroma index has
+# changed since they were computed (queued upserts apply after the write
+# returns). Cards leave out stock, which orders change without a product write.
+RECOMMENDATION_TTL = 300
+RECOMMENDATION_CACHE_SIZE = 10_000
+_recommendations: "OrderedDict[Tuple[Optional[str], int], Tuple[float, int, List[dict], str]]" = OrderedDict()
+
+
+def _cached_recommendations(key: Tuple[Optional[str], int]) -> Optional[Tuple[List[dict], str]]:
+    """(products_list, etag) if cached, fresh and computed on the current index"""
+    entry = _recommendations.get(key)
+    if entry is None:
+        return None
+    expires_at, index_version, products_list, etag = entry
+    if expires_at < time.monotonic() or index_version != ChromaStore.products_version:
+        del _recommendations[key]
+        return None
+    _recommendations.move_to_end(key)
+    return products_list, etag
+
+
+def _cache_recommendations(
+    key: Tuple[Optional[str], int], index_version: int, products_list: List[dict]
+) -> str:
+    """Store a result computed on index_version and return its ETag"""
+    etag = '"' + hashlib.sha1(json.dumps(products_list, sort_keys=True).encode()).hexdigest() + '"'
+    _recommendations[key] = (
+        time.monotonic() + RECOMMENDATION_TTL, index_version, products_list, etag
+    )
+    _recommendations.move_to_end(key)
+    while len(_recommendations) > RECOMMENDATION_CACHE_SIZE:
+        _recommendations.popitem(last=False)
+    return etag
+
 
 # Request/Response models
 class CreateProductRequest(BaseModel):
@@ -37,11 +80,48 @@ class UpdateProductRequest(BaseModel):
     specifications: Optional[dict] = None
 
 
+def _product_card(p) -> dict:
+    """Listing shape for a Product or ProductSummary. Column types already
+    match the JSON types (String/Float/Integer), so values pass through as-is."""
+    return {
+        "id": p.id,
+        "name": p.name,
+        "description": p.description,
+        "price": p.price,
+        "stock": p.stock,
+        "category": p.category,
+        "image_url": p.images[0] if p.images else None,
+        "sku": p.sku
+    }
+
+
+def _recommendation_card(p) -> dict:
+    """Product card without stock, which may not be cached"""
+    card = _product_card(p)
+    del card["stock"]
+    return card
+
+
+async def _index_product(product: Product):
+    """
+    Queue the product for background embedding + upsert so the response
+    only waits on the SQL write; index inline if the queue is full.
+    """
+    fields = dict(
+        product_id=product.id,
+        name=product.name,
+        description=product.description,
+        category=product.category,
+        sku=product.sku
+    )
+    if not ChromaStore.enqueue_product_upsert(**fields):
+        await ChromaStore.upsert_product(**fields)
+    _recommendations.clear()
+
+
 @router.post("/", response_model=dict)
-async def create_product(request: CreateProductRequest):
+async def create_product(request: CreateProductRequest, session: AsyncSession = Depends(Database.get_session)):
     """Create a new product"""
-    session_gen = Database.get_session()
-    session = await anext(session_gen)
     try:
         product_repo = SQLAlchemyProductRepository(session)
 
@@ -62,13 +142,7 @@ async def create_product(request: CreateProductRequest):
         await product_repo.create(product)
 
         # Index in ChromaDB for RAG
-        await ChromaStore.upsert_product(
-            product_id=product.id,
-            name=product.name,
-            description=product.description,
-            category=product.category,
-            sku=product.sku
-        )
+        await _index_product(product)
 
         return {
             "message": "Product created successfully",
@@ -76,15 +150,75 @@ async def create_product(request: CreateProductRequest):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await session.close()
+
+
+# Declared before /{product_id} so "recommend" is not captured as an id
+@router.get("/recommend")
+async def recommend_products(
+    request: Request,
+    response: Response,
+    product_id: Optional[str] = None,
+    limit: int = 5,
+    session: AsyncSession = Depends(Database.get_session)
+):
+    """Get product recommendations based on a product ID or general recommendations"""
+    try:
+        cache_key = (product_id, limit)
+        cached = _cached_recommendations(cache_key)
+        if cached is not None:
+            products_list, etag = cached
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "public, max-age=60"
+            return {
+                "products": products_list,
+                "count": len(products_list)
+            }
+
+        # Read before searching: an upsert landing mid-request makes this
+        # result stale, and the version check then discards it
+        index_version = ChromaStore.products_version
+        product_repo = SQLAlchemyProductRepository(session)
+
+        if product_id:
+            # Get the product to base recommendations on
+            product = await product_repo.get_by_id(product_id)
+            if not product:
+                raise HTTPException(status_code=404, detail="Product not found")
+
+            # Use ChromaDB to find similar products
+            similar_results = await ChromaStore.search_products(
+                query=product.description,
+                top_k=limit + 1  # +1 to exclude the product itself
+            )
+
+            # Extract product IDs from search results and get full product data
+            product_ids = [r["id"] for r in similar_results if r["id"] != product_id]
+            similar_products = await product_repo.get_by_ids(product_ids[:limit])
+            recommendations = similar_products
+        else:
+            # Return popular or random products
+            recommendations = await product_repo.list_summaries(limit)
+
+        # Format for frontend
+        products_list = [_recommendation_card(p) for p in recommendations]
+        response.headers["ETag"] = _cache_recommendations(cache_key, index_version, products_list)
+        response.headers["Cache-Control"] = "public, max-age=60"
+
+        return {
+            "products": products_list,
+            "count": len(products_list)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{product_id}")
-async def get_product(product_id: str):
+async def get_product(product_id: str, session: AsyncSession = Depends(Database.get_session)):
     """Get product by ID"""
-    session_gen = Database.get_session()
-    session = await anext(session_gen)
     try:
         product_repo = SQLAlchemyProductRepository(session)
         product = await product_repo.get_by_id(product_id)
@@ -97,8 +231,6 @@ async def get_product(product_id: str):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await session.close()
 
 
 @router.get("/")
@@ -107,97 +239,95 @@ async def search_products(
     category: Optional[str] = None,
     page: int = 1,
     page_size: int = 10,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(Database.get_session)
 ):
-    """Search products or list all with pagination"""
-    session_gen = Database.get_session()
-    session = await anext(session_gen)
+    """
+    Search products or list all with pagination
+
+    Pass the previous response's ``next_cursor`` as ``cursor`` to get the next
+    page with a keyset seek on the primary key, whatever the depth. ``page``
+    (offset pagination, capped at ``limit`` matches) is deprecated and
+    ignored when ``cursor`` is given; the response then reports ``page`` as
+    null.
+    """
     try:
         product_repo = SQLAlchemyProductRepository(session)
 
-        if category:
-            all_products = await product_repo.get_by_category(category, limit)
-        elif query:
-            all_products = await product_repo.search(query, limit)
+        if cursor:
+            try:
+                after_id = base64.urlsafe_b64decode(cursor.encode()).decode()
+            except (binascii.Error, UnicodeDecodeError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            paginated_products, remaining = await product_repo.page_summaries(
+                0, page_size, query=query, category=category, after_id=after_id
+            )
+            total_count = await product_repo.count(query, category)
+            # In keyset mode the window count covers only rows after the cursor
+            has_more = remaining > len(paginated_products)
         else:
-            all_products = await product_repo.list_all()
+            # Results are capped at `limit` matches; page within that window in SQL
+            offset = (page - 1) * page_size
+            page_limit = min(page_size, limit - offset)
+            if page_limit > 0:
+                paginated_products, total_count = await product_repo.page_summaries(
+                    offset, page_limit, query=query, category=category
+                )
+            else:
+                paginated_products, total_count = [], await product_repo.count(query, category)
+            total_count = min(total_count, limit)
+            has_more = offset + len(paginated_products) < total_count
 
         # Calculate pagination
-        total_count = len(all_products)
         total_pages = (total_count + page_size - 1) // page_size
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        paginated_products = all_products[start_idx:end_idx]
+        next_cursor = None
+        if has_more and paginated_products:
+            next_cursor = base64.urlsafe_b64encode(paginated_products[-1].id.encode()).decode()
 
         # Format for frontend
-        products_list = [
-            {
-                "id": str(p.id),
-                "name": p.name,
-                "description": p.description,
-                "price": float(p.price),
-                "stock": int(p.stock),
-                "category": p.category,
-                "image_url": p.images[0] if p.images else None,
-                "sku": p.sku
-            }
-            for p in paginated_products
-        ]
+        products_list = [_product_card(p) for p in paginated_products]
 
         return {
             "products": products_list,
             "count": len(products_list),
             "total": total_count,
-            "page": page,
+            "page": None if cursor else page,
             "page_size": page_size,
-            "total_pages": total_pages
+            "total_pages": total_pages,
+            "next_cursor": next_cursor
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await session.close()
 
 
 @router.put("/{product_id}")
-async def update_product(product_id: str, request: UpdateProductRequest):
+async def update_product(
+    product_id: str,
+    request: UpdateProductRequest,
+    session: AsyncSession = Depends(Database.get_session)
+):
     """Update product"""
-    session_gen = Database.get_session()
-    session = await anext(session_gen)
     try:
         product_repo = SQLAlchemyProductRepository(session)
 
-        # Get existing product
-        product = await product_repo.get_by_id(product_id)
+        # Fields to update: empty text/collections are ignored, 0 is a valid
+        # price/stock
+        fields = {
+            key: value
+            for key, value in request.model_dump(exclude_none=True).items()
+            if value or key in ("price", "stock")
+        }
+
+        # Save to database (one UPDATE ... RETURNING)
+        product = await product_repo.update_partial(product_id, fields)
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
-        # Update fields
-        if request.name:
-            product.name = request.name
-        if request.description:
-            product.description = request.description
-        if request.category:
-            product.category = request.category
-        if request.price is not None:
-            product.price = request.price
-        if request.stock is not None:
-            product.stock = request.stock
-        if request.images:
-            product.images = request.images
-        if request.specifications:
-            product.specifications = request.specifications
-
-        # Save to database
-        await product_repo.update(product)
-
         # Re-index in ChromaDB
-        await ChromaStore.upsert_product(
-            product_id=product.id,
-            name=product.name,
-            description=product.description,
-            category=product.category,
-            sku=product.sku
-        )
+        await _index_product(product)
 
         return {
             "message": "Product updated successfully",
@@ -207,8 +337,6 @@ async def update_product(product_id: str, request: UpdateProductRequest):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await session.close()
 
 
 @router.delete("/{product_id}")
@@ -217,6 +345,7 @@ async def delete_product(product_id: str):
     try:
         # Delete from ChromaDB
         await ChromaStore.delete_product(product_id)
+        _recommendations.clear()
 
         return {
             "message": "Product deleted successfully",
@@ -227,10 +356,8 @@ async def delete_product(product_id: str):
 
 
 @router.get("/{product_id}/stock")
-async def check_stock(product_id: str):
+async def check_stock(product_id: str, session: AsyncSession = Depends(Database.get_session)):
     """Check product stock"""
-    session_gen = Database.get_session()
-    session = await anext(session_gen)
     try:
         product_repo = SQLAlchemyProductRepository(session)
         stock = await product_repo.check_stock(product_id)
@@ -242,61 +369,3 @@ async def check_stock(product_id: str):
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await session.close()
-
-
-@router.get("/recommend")
-async def recommend_products(product_id: Optional[str] = None, limit: int = 5):
-    """Get product recommendations based on a product ID or general recommendations"""
-    session_gen = Database.get_session()
-    session = await anext(session_gen)
-    try:
-        product_repo = SQLAlchemyProductRepository(session)
-
-        if product_id:
-            # Get the product to base recommendations on
-            product = await product_repo.get_by_id(product_id)
-            if not product:
-                raise HTTPException(status_code=404, detail="Product not found")
-
-            # Use ChromaDB to find similar products
-            similar_results = await ChromaStore.search_products(
-                query=product.description,
-                top_k=limit + 1  # +1 to exclude the product itself
-            )
-
-            # Extract product IDs from search results and get full product data
-            product_ids = [r["id"] for r in similar_results if r["id"] != product_id]
-            similar_products = await product_repo.get_by_ids(product_ids[:limit])
-            recommendations = similar_products
-        else:
-            # Return popular or random products
-            all_products = await product_repo.list_all()
-            recommendations = all_products[:limit]
-
-        # Format for frontend
-        products_list = [
-            {
-                "id": str(p.id),
-                "name": p.name,
-                "description": p.description,
-                "price": float(p.price),
-                "stock": int(p.stock),
-                "category": p.category,
-                "image_url": p.images[0] if p.images else None,
-                "sku": p.sku
-            }
-            for p in recommendations
-        ]
-
-        return {
-            "products": products_list,
-            "count": len(products_list)
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        await session.close()
@@ -6,10 +6,13 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 import aiohttp
-from ...config import settings
+from ...infrastructure.openai.audio_client import get_session
 
 router = APIRouter()
 
+# Bytes forwarded per chunk while relaying the MP3 from OpenAI
+AUDIO_CHUNK_SIZE = 8192
+
 
 class TTSRequest(BaseModel):
     text: str
@@ -35,11 +38,6 @@ async def text_to_speech(request: TTSRequest):
     try:
         url = "https://api.openai.com/v1/audio/speech"
         
-        headers = {
-            "Authorization": f"Bearer {settings.openai_api_key}",
-            "Content-Type": "application/json"
-        }
-        
         payload = {
             "model": request.model,
             "input": request.text,
@@ -47,24 +45,32 @@ async def text_to_speech(request: TTSRequest):
             "speed": request.speed
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"OpenAI TTS API error: {error_text}"
-                    )
-                
-                audio_content = await response.read()
-                
-                return StreamingResponse(
-                    iter([audio_content]),
-                    media_type="audio/mpeg",
-                    headers={
-                        "Content-Disposition": "inline; filename=speech.mp3"
-                    }
-                )
+        # Shared OpenAI session (pooled keep-alive connections, auth preset).
+        # The response stays open while the audio streams; the generator
+        # below releases its connection back to the pool when done
+        response = await get_session().post(url, json=payload)
+        if response.status != 200:
+            error_text = await response.text()
+            response.release()
+            raise HTTPException(
+                status_code=response.status,
+                detail=f"OpenAI TTS API error: {error_text}"
+            )
+        
+        async def audio_chunks():
+            try:
+                async for chunk in response.content.iter_chunked(AUDIO_CHUNK_SIZE):
+                    yield chunk
+            finally:
+                response.release()
+        
+        return StreamingResponse(
+            audio_chunks(),
+            media_type="audio/mpeg",
+            headers={
+                "Content-Disposition": "inline; filename=speech.mp3"
+            }
+        )
     
     except aiohttp.ClientError as e:
         raise HTTPException(status_code=500, detail=f"Network error: {str(e)}")
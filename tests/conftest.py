@@ -0,0 +1,31 @@
+"""
+Shared fixtures: a fresh in-memory SQLite database per test
+"""
+import asyncio
+
+import pytest
+
+from src.config import settings
+from src.infrastructure.database.mongodb import MongoDB
+
+
+@pytest.fixture
+def run_with_db(monkeypatch):
+    """
+    Run a coroutine function against a freshly created in-memory database.
+    Connecting, the scenario and disconnecting share one event loop, since
+    the engine's connection is bound to the loop that opened it.
+    """
+    monkeypatch.setattr(settings, "database_url", "sqlite+aiosqlite:///:memory:")
+
+    def run(scenario):
+        async def wrapped():
+            await MongoDB.connect()
+            try:
+                return await scenario()
+            finally:
+                await MongoDB.disconnect()
+
+        return asyncio.run(wrapped())
+
+    return run
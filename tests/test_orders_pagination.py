@@ -0,0 +1,55 @@
+"""
+/orders keyset pagination on (created_at, id)
+"""
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+pytest.importorskip("langgraph")
+
+from src.infrastructure.database.models import CustomerModel, OrderModel
+from src.infrastructure.database.sqlite_db import Database
+from src.presentation.routes.agent import get_orders
+
+
+async def _seed_orders():
+    async with Database.session_scope() as session:
+        session.add(CustomerModel(id="cust-1", name="Ana Torres"))
+        # Five orders share one timestamp (bulk seed); two are newer
+        for i in range(7):
+            session.add(OrderModel(
+                id=f"order-{i}", order_number=f"ord-{i:03d}", customer_id="cust-1",
+                subtotal=10.0, total=10.0, status="paid",
+                created_at=datetime(2026, 1, 3) if i >= 5 else datetime(2026, 1, 2),
+            ))
+        await session.commit()
+
+
+def test_cursor_pages_through_tied_timestamps(run_with_db):
+    async def scenario():
+        await _seed_orders()
+        pages = []
+        cursor = None
+        while True:
+            page = await get_orders(page_size=2, cursor=cursor)
+            pages.append(page)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    pages = run_with_db(scenario)
+
+    seen = [order["id"] for page in pages for order in page["orders"]]
+    assert seen == ["order-6", "order-5", "order-4", "order-3", "order-2", "order-1", "order-0"]
+    assert pages[0]["page"] == 1
+    assert all(page["page"] is None for page in pages[1:])
+
+
+def test_malformed_cursor_is_rejected(run_with_db):
+    async def scenario():
+        with pytest.raises(HTTPException) as excinfo:
+            await get_orders(cursor="not-a-cursor")
+        return excinfo.value.status_code
+
+    assert run_with_db(scenario) == 400
@@ -0,0 +1,72 @@
+"""
+Receipt route against a real SQLite database
+"""
+import asyncio
+from datetime import datetime
+
+import httpx
+from fastapi import FastAPI
+
+from src.config import settings
+from src.infrastructure.database.models import (
+    CustomerModel, OrderItemModel, OrderModel, ProductModel
+)
+from src.infrastructure.database.mongodb import MongoDB
+from src.infrastructure.database.sqlite_db import Database
+from src.presentation.routes import receipt
+
+
+async def _seed_order():
+    async with Database.session_scope() as session:
+        session.add_all([
+            CustomerModel(id="cust-1", name="Ana Torres"),
+            ProductModel(
+                id="prod-1", name="Inca Kola 1.5L", description="Gaseosa",
+                category="bebidas", price=7.5, stock=10, sku="IK-15",
+            ),
+            OrderModel(
+                id="order-1", order_number="ord-001", customer_id="cust-1",
+                subtotal=15.0, total=15.0, status="paid",
+                created_at=datetime(2026, 1, 2, 10, 30),
+            ),
+            OrderItemModel(
+                id="item-1", order_id="order-1", product_id="prod-1",
+                quantity=2, unit_price=7.5, subtotal=15.0,
+            ),
+        ])
+        await session.commit()
+
+
+def test_receipt_renders_order_with_items(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "database_url", f"sqlite+aiosqlite:///{tmp_path / 'receipt.db'}")
+    receipt._receipts.clear()
+    app = FastAPI()
+    app.include_router(receipt.router)
+
+    async def scenario():
+        await MongoDB.connect()
+        try:
+            await _seed_order()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = await client.get("/orders/ord-001/receipt")
+                cached = await client.get(
+                    "/orders/ord-001/receipt",
+                    headers={"If-None-Match": first.headers["etag"]},
+                )
+                missing = await client.get("/orders/nope/receipt")
+            return first, cached, missing
+        finally:
+            await MongoDB.disconnect()
+
+    first, cached, missing = asyncio.run(scenario())
+
+    assert first.status_code == 200
+    assert "#ORD-001" in first.text
+    assert "Inca Kola 1.5L" in first.text
+    assert "$15.00" in first.text
+    assert "Pagado" in first.text
+    assert len(receipt._receipts) == 1
+
+    assert cached.status_code == 304
+    assert missing.status_code == 404
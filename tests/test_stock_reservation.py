@@ -0,0 +1,167 @@
+"""
+Stock reservations: unique (conversation_id, product_id) rows and the
+stock-bounded UPSERT in reserve_stock
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select, text, update
+from sqlalchemy.exc import IntegrityError
+
+from src.infrastructure.database.models import (
+    Base, ProductModel, StockReservationModel,
+    create_missing_indexes, merge_duplicate_stock_reservations,
+)
+from src.infrastructure.database.sqlite_db import Database
+from src.infrastructure.services.stock_reservation import StockReservationService
+
+
+async def _seed_product(stock: int = 10):
+    async with Database.session_scope() as session:
+        session.add(ProductModel(
+            id="prod-1", name="Inca Kola 1.5L", description="Gaseosa",
+            category="bebidas", price=7.5, stock=stock, sku="IK-15",
+        ))
+        await session.commit()
+
+
+async def _reservations():
+    async with Database.read_scope() as conn:
+        result = await conn.execute(
+            select(
+                StockReservationModel.conversation_id,
+                StockReservationModel.quantity,
+            ).order_by(StockReservationModel.conversation_id)
+        )
+        return [tuple(row) for row in result]
+
+
+def test_duplicates_are_merged_before_unique_index():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        conn.execute(text("DROP INDEX uq_stock_reservations_conversation_product"))
+        conn.execute(text("INSERT INTO products (id, name, description, category, price, stock, sku) "
+                          "VALUES ('prod-1', 'Inca Kola', 'Gaseosa', 'bebidas', 7.5, 10, 'IK-15')"))
+        conn.execute(
+            StockReservationModel.__table__.insert(),
+            [
+                {"id": "r1", "conversation_id": "conv-1", "product_id": "prod-1",
+                 "quantity": 1, "expires_at": datetime(2026, 1, 1, 10)},
+                {"id": "r2", "conversation_id": "conv-1", "product_id": "prod-1",
+                 "quantity": 2, "expires_at": datetime(2026, 1, 1, 12)},
+                {"id": "r3", "conversation_id": "conv-2", "product_id": "prod-1",
+                 "quantity": 4, "expires_at": datetime(2026, 1, 1, 11)},
+            ],
+        )
+
+    with engine.begin() as conn:
+        merge_duplicate_stock_reservations(conn)
+        create_missing_indexes(conn)
+
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(
+                StockReservationModel.conversation_id,
+                StockReservationModel.quantity,
+                StockReservationModel.expires_at,
+            ).order_by(StockReservationModel.conversation_id)
+        ).all()
+        assert [tuple(row) for row in rows] == [
+            ("conv-1", 3, datetime(2026, 1, 1, 12)),
+            ("conv-2", 4, datetime(2026, 1, 1, 11)),
+        ]
+        with pytest.raises(IntegrityError):
+            conn.execute(StockReservationModel.__table__.insert(), {
+                "id": "r4", "conversation_id": "conv-2", "product_id": "prod-1",
+                "quantity": 1, "expires_at": datetime(2026, 1, 1, 13),
+            })
+
+
+def test_second_add_increments_the_same_row(run_with_db):
+    service = StockReservationService()
+
+    async def scenario():
+        await _seed_product(stock=10)
+        first = await service.reserve_stock("conv-1", "prod-1", 2, "user-1")
+        second = await service.reserve_stock("conv-1", "prod-1", 3, "user-1")
+        return first, second, await _reservations()
+
+    first, second, rows = run_with_db(scenario)
+
+    assert first["success"] and second["success"]
+    assert second["reserved_quantity"] == 5
+    assert second["available_stock"] == 5
+    assert rows == [("conv-1", 5)]
+
+
+def test_add_past_available_stock_is_rejected(run_with_db):
+    service = StockReservationService()
+
+    async def scenario():
+        await _seed_product(stock=10)
+        held = await service.reserve_stock("conv-1", "prod-1", 8, "user-1")
+        own_overflow = await service.reserve_stock("conv-1", "prod-1", 5, "user-1")
+        other_overflow = await service.reserve_stock("conv-2", "prod-1", 3, "user-2")
+        fits = await service.reserve_stock("conv-2", "prod-1", 2, "user-2")
+        return held, own_overflow, other_overflow, fits, await _reservations()
+
+    held, own_overflow, other_overflow, fits, rows = run_with_db(scenario)
+
+    assert held["success"]
+    assert not own_overflow["success"]
+    assert own_overflow["available_stock"] == 2
+    assert not other_overflow["success"]
+    assert fits["success"]
+    assert rows == [("conv-1", 8), ("conv-2", 2)]
+
+
+def test_upsert_enforces_stock_bound_without_precheck(run_with_db):
+    """The statement itself rejects a write a concurrent reservation made too large"""
+
+    async def scenario():
+        await _seed_product(stock=10)
+        now = datetime.utcnow()
+        expires_at = now + timedelta(minutes=15)
+        async with Database.session_scope() as session:
+            held = await StockReservationService._upsert_reservation(
+                session, "conv-1", "prod-1", 7, now, expires_at
+            )
+            rejected_insert = await StockReservationService._upsert_reservation(
+                session, "conv-2", "prod-1", 4, now, expires_at
+            )
+            rejected_update = await StockReservationService._upsert_reservation(
+                session, "conv-1", "prod-1", 4, now, expires_at
+            )
+            await session.commit()
+        return held, rejected_insert, rejected_update, await _reservations()
+
+    held, rejected_insert, rejected_update, rows = run_with_db(scenario)
+
+    assert held == 7
+    assert rejected_insert is None
+    assert rejected_update is None
+    assert rows == [("conv-1", 7)]
+
+
+def test_expired_own_reservation_is_reset_not_grown(run_with_db):
+    service = StockReservationService()
+
+    async def scenario():
+        await _seed_product(stock=10)
+        await service.reserve_stock("conv-1", "prod-1", 6, "user-1")
+        async with Database.session_scope() as session:
+            await session.execute(
+                update(StockReservationModel).values(
+                    expires_at=datetime.utcnow() - timedelta(minutes=1)
+                )
+            )
+            await session.commit()
+        again = await service.reserve_stock("conv-1", "prod-1", 6, "user-1")
+        return again, await _reservations()
+
+    again, rows = run_with_db(scenario)
+
+    assert again["success"]
+    assert again["reserved_quantity"] == 6
+    assert rows == [("conv-1", 6)]